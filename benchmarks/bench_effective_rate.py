@@ -0,0 +1,42 @@
+"""My金利計算のマイクロベンチマーク
+
+以前の apply(lambda) での計算と、kinri_calc.effective_rate を比べます。
+
+    python benchmarks/bench_effective_rate.py [行数 ...]
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from kinri_calc import effective_rate  # noqa: E402
+
+DISCOUNT = 1.85
+
+
+def apply_path(store):
+    rate = store - DISCOUNT
+    return rate.apply(lambda x: max(0, x))
+
+
+def vectorized_path(store):
+    return effective_rate(store, DISCOUNT)
+
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>10} {'apply (ms)':>12} {'vectorized (ms)':>16} {'speedup':>8}")
+    for n in sizes:
+        store = pd.Series(rng.choice([1.5, 1.8, 2.475, 2.6], size=n))
+        assert np.allclose(apply_path(store), vectorized_path(store))
+        repeat = max(1, 200_000 // n)
+        t_apply = min(timeit.repeat(lambda: apply_path(store), number=repeat, repeat=3)) / repeat
+        t_vec = min(timeit.repeat(lambda: vectorized_path(store), number=repeat, repeat=3)) / repeat
+        print(f"{n:>10} {t_apply * 1e3:>12.3f} {t_vec * 1e3:>16.3f} {t_apply / t_vec:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [1_000, 100_000, 1_000_000])
@@ -0,0 +1,182 @@
+"""kinri.py のデータ処理を段階ごとに計測するベンチマーク
+
+Date,BOJ,MUFG,Yokohama,Johoku 形式の合成データを行数・間隔ごとに作り、
+取り込み(パース)・並べ替え・金利変更の抽出・足ごとのリサンプル・チャート用データ作成・
+My金利計算・Vega-Lite spec の組み立てとサイズと、保存データ(SQLite)への問い合わせを、
+それぞれ別々に計測します。
+結果は1計測1行の JSON (JSON Lines) で出力するので、実行ごとに比較できます。
+
+    python benchmarks/bench_pipeline.py --rows 1000 100000 1000000 --cadence min D --out bench.jsonl
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from kinri_calc import downsample_steps, my_rate_series  # noqa: E402
+from kinri_chart import build_chart_source, build_rate_chart  # noqa: E402
+from kinri_data import TIMEFRAMES, build_timeframe, parse_csv  # noqa: E402
+from kinri_db import RateDatabase  # noqa: E402
+from kinri_events import ChangeIndex  # noqa: E402
+from kinri_sources import SHEET_SERIES  # noqa: E402
+
+# 合成データの間隔（pandas の頻度文字列）
+CADENCES = {
+    'min': 'min',
+    'h': 'h',
+    'D': 'D',
+    'W': 'W',
+    'YE': 'YE',
+}
+# 合成データの初期値（スプレッドシートの列名のまま）
+START_RATES = {'BOJ': -0.1, 'MUFG': 2.475, 'Yokohama': 2.475, 'Johoku': 2.6}
+LABELS = {s.column: s.label for s in SHEET_SERIES}
+MY_BANK = '横浜'
+DISCOUNT = 1.85
+
+
+def make_history(rows, cadence, changes_per_series=8, seed=0):
+    """階段状に動く金利履歴の CSV(bytes) を作る"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end='2026-01-01', periods=rows, freq=CADENCES[cadence])
+    data = {'Date': dates.strftime('%Y-%m-%d %H:%M:%S')}
+    for column, start in START_RATES.items():
+        steps = np.zeros(rows)
+        at = rng.integers(1, max(2, rows), size=min(changes_per_series, rows))
+        steps[at] = rng.choice([-0.25, -0.1, 0.1, 0.25], size=len(at))
+        data[column] = np.round(start + np.cumsum(steps), 3)
+    return pd.DataFrame(data).to_csv(index=False, lineterminator='\r\n').encode()
+
+
+def best_of(repeat, func):
+    """repeat 回実行して最速の時間(秒)と最後の戻り値を返す"""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def run_case(rows, cadence, repeat, max_points):
+    """1つの合成データについて各段階を計測し、計測結果の dict を順に返す"""
+    base = {'rows': rows, 'cadence': cadence}
+    try:
+        raw = make_history(rows, cadence)
+    except pd.errors.OutOfBoundsDatetime:
+        # 年足で100万行など、pandas の日付の範囲に収まらない組み合わせは飛ばす
+        yield {**base, 'stage': 'skipped', 'reason': 'out of datetime range'}
+        return
+    yield {**base, 'stage': 'csv_bytes', 'seconds': 0.0, 'bytes': len(raw)}
+
+    seconds, (df, rejected) = best_of(repeat, lambda: parse_csv(raw, LABELS))
+    yield {**base, 'stage': 'parse', 'seconds': seconds, 'rejected_rows': rejected}
+
+    # 元の並び順に結果が左右されないよう、シャッフルしてから並べ替えを計測する
+    shuffled = df.sample(frac=1, random_state=0)
+    seconds, df_sorted = best_of(repeat, lambda: shuffled.sort_values('Date', ignore_index=True))
+    yield {**base, 'stage': 'sort', 'seconds': seconds}
+
+    # アプリと同じく、金利が変わった行だけの表から足ごとの集計を作る
+    seconds, df_steps = best_of(repeat, lambda: ChangeIndex.from_frame(df_sorted).step_frame())
+    yield {**base, 'stage': 'events', 'seconds': seconds, 'out_rows': len(df_steps)}
+
+    yield from run_database(base, df_sorted, repeat)
+
+    indexed = df_steps.set_index('Date')
+    for timeframe in TIMEFRAMES:
+        tf = {**base, 'timeframe': timeframe}
+
+        seconds, frame = best_of(repeat, lambda: build_timeframe(df_steps, timeframe, indexed))
+        yield {**tf, 'stage': 'resample', 'seconds': seconds, 'out_rows': len(frame)}
+
+        bank_columns = [c for c in frame.columns if c != 'Date']
+        seconds, display = best_of(repeat, lambda: downsample_steps(frame, bank_columns, max_points))
+        yield {**tf, 'stage': 'downsample', 'seconds': seconds, 'out_rows': len(display)}
+
+        seconds, _ = best_of(repeat, lambda: my_rate_series(frame, MY_BANK, DISCOUNT))
+        yield {**tf, 'stage': 'my_rate', 'seconds': seconds, 'out_rows': len(frame)}
+
+        # 以前の melt + concat によるチャート用データ作成(比較用)
+        seconds, legacy = best_of(repeat, lambda: legacy_melt_concat(display))
+        yield {**tf, 'stage': 'melt_concat_legacy', 'seconds': seconds, 'out_rows': len(legacy)}
+
+        seconds, source = best_of(repeat, lambda: build_chart_source(display, MY_BANK, DISCOUNT))
+        yield {**tf, 'stage': 'chart_source', 'seconds': seconds, 'out_rows': len(source)}
+
+        seconds, spec = best_of(repeat, lambda: build_rate_chart(source).to_dict())
+        yield {**tf, 'stage': 'spec_build', 'seconds': seconds}
+
+        seconds, payload = best_of(repeat, lambda: json.dumps(spec, ensure_ascii=False).encode())
+        yield {**tf, 'stage': 'spec_json', 'seconds': seconds, 'bytes': len(payload)}
+
+
+def run_database(base, df_sorted, repeat):
+    """保存データ(SQLite)への保存と、履歴を読み込まずに答える問い合わせを計測する"""
+    with tempfile.TemporaryDirectory() as tmp:
+        database = RateDatabase(os.path.join(tmp, 'kinri.sqlite'))
+        seconds, _ = best_of(1, lambda: database.save('bench', df_sorted, {}))
+        yield {**base, 'stage': 'db_save', 'seconds': seconds,
+               'bytes': os.path.getsize(database.path)}
+
+        # 履歴の最後の1割の期間
+        start = df_sorted['Date'].iloc[len(df_sorted) * 9 // 10]
+        seconds, _ = best_of(repeat, database.latest)
+        yield {**base, 'stage': 'db_latest', 'seconds': seconds}
+        seconds, count = best_of(repeat, lambda: database.count(start))
+        yield {**base, 'stage': 'db_count', 'seconds': seconds, 'out_rows': count}
+        seconds, page = best_of(repeat, lambda: database.samples(start, limit=100, offset=count // 2))
+        yield {**base, 'stage': 'db_page', 'seconds': seconds, 'out_rows': len(page)}
+        for timeframe, rule in TIMEFRAMES.items():
+            if rule is None:
+                continue
+            seconds, frame = best_of(repeat, lambda: database.resample(rule, start))
+            yield {**base, 'timeframe': timeframe, 'stage': 'db_resample', 'seconds': seconds,
+                   'out_rows': len(frame)}
+
+
+def legacy_melt_concat(display):
+    chart_data = display.melt('Date', var_name='Bank', value_name='Rate')
+    my_rate_data = display[['Date']].assign(Rate=my_rate_series(display, MY_BANK, DISCOUNT), Bank="★My金利")
+    return pd.concat([chart_data, my_rate_data[['Date', 'Bank', 'Rate']]])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 100_000, 1_000_000],
+                        help='合成データの行数(1000〜10000000 程度)')
+    parser.add_argument('--cadence', nargs='+', choices=list(CADENCES), default=['min', 'D', 'YE'],
+                        help='合成データの間隔')
+    parser.add_argument('--repeat', type=int, default=3, help='各段階の繰り返し回数(最速値を記録)')
+    parser.add_argument('--max-points', type=int, default=2000, help='チャートの最大行数')
+    parser.add_argument('--out', help='結果を書き出す JSON Lines ファイル(省略時は標準出力)')
+    args = parser.parse_args(argv)
+
+    run = {
+        'run_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+    }
+    out = open(args.out, 'w', encoding='utf-8') if args.out else sys.stdout
+    try:
+        for cadence in args.cadence:
+            for rows in args.rows:
+                for record in run_case(rows, cadence, args.repeat, args.max_points):
+                    out.write(json.dumps({**run, **record}, ensure_ascii=False) + '\n')
+                    out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
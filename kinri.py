@@ -1,80 +1,167 @@
-import streamlit as st
+import functools
+import os
+
+import numpy as np
 import pandas as pd
-import altair as alt
+import streamlit as st
+
+from kinri_api import API_HOST, API_PORT, start_server
+from kinri_calc import date_range_slice, downsample_steps, effective_rate, history_page, my_rate_series
+from kinri_chart import SpecCache, build_band_chart, build_forecast_chart, rate_chart_spec
+from kinri_data import TIMEFRAMES, RateRefresher
+from kinri_engine import DEFAULT_BANK, DEFAULT_DISCOUNT, PORTFOLIO_PATH, make_sources, open_database
+from kinri_forecast import fit_pass_through, forecast_bands, simulate_store_paths
+from kinri_loan import ANNUITY, PERCENTILES, REPAYMENT_METHODS, AmortizationSchedule, simulate_repayment, store_rate_scenarios
+from kinri_perf import RunTimer
+from kinri_portfolio import LOAN_COLUMNS, price_portfolio, read_loans
+from kinri_sources import MultiSourceFetcher
 
 # ==========================================
-# 👇 スプレッドシートのURL（そのままでOK）
-CSV_URL = "https://docs.google.com/spreadsheets/d/e/2PACX-1vS8hJRst-sZ2V_rzHW77OK5NBbDGRwJ8O7bYNoofq2l7gtqE8ZzPSUq39xPI4IDp4-q1NXdapzo-hZE/pub?output=csv"
+# (スプレッドシートのURL・銀行と優遇幅の初期値・保存先は kinri_engine.py に、
+#  HTTP API の待ち受け先は kinri_api.py にあります)
+# 裏で再取得する間隔（秒）
+REFRESH_INTERVAL = int(os.environ.get("KINRI_REFRESH_INTERVAL", "600"))
+# チャートに渡す最大行数（変化点だけにしても超えるときは LTTB で間引きます）
+CHART_MAX_POINTS = int(os.environ.get("KINRI_CHART_MAX_POINTS", "2000"))
+# 組み立て済みチャートを覚えておくキャッシュの上限（バイト）
+SPEC_CACHE_BYTES = int(os.environ.get("KINRI_SPEC_CACHE_BYTES", str(32 * 1024 * 1024)))
 # ==========================================
 
 st.set_page_config(page_title="My金利ウォッチ", page_icon="🏦", layout="wide")
 
+# 段階ごとの処理時間を毎回記録します（計測パネルを開いているときはメモリも測ります）
+timer = RunTimer(trace_memory=st.session_state.get("debug_panel", False))
+# ページ全体の実行中かどうか（部品だけの再実行では False のまま）
+st.session_state["full_run"] = True
+
 # --- データの読み込みと日本語化 ---
-@st.cache_data(ttl=600)
-def load_data():
-    try:
-        df = pd.read_csv(CSV_URL)
-        if df.empty: return None
-        df['Date'] = pd.to_datetime(df['Date'])
-        
-        # ★ここで列名を日本語に変換します！
-        # (グラフの凡例もこれに合わせて自動で変わります)
-        df = df.rename(columns={
-            'BOJ': '日銀',
-            'MUFG': 'UFJ',
-            'Yokohama': '横浜',
-            'Johoku': '城北'
-        })
-        return df
-    except Exception:
+# (金利のソースは kinri_engine.make_sources で作ります)
+# 取り込みはプロセス全体で1本のスレッドが裏で定期的に行います
+# (ソースが複数あるときは並行して取り込み、遅いソースは前回の値のまま表示します)
+@st.cache_resource
+def get_refresher():
+    fetcher = MultiSourceFetcher(make_sources())
+    return RateRefresher(fetcher, interval=REFRESH_INTERVAL).start()
+
+# 全サンプルの表は、履歴をメモリに読み込まずにデータベースから1ページずつ読みます（保存しない設定なら None）
+@st.cache_resource
+def get_database():
+    return open_database()
+
+# ほかのツール向けの HTTP API を、画面と同じ取り込み済みのデータで裏で動かします（プロセスに1つ）
+@st.cache_resource
+def get_api_server():
+    if not API_PORT:
         return None
+    refresher = get_refresher()
+    return start_server(lambda: refresher.snapshot, API_HOST, API_PORT)
 
-df = load_data()
+@st.cache_resource
+def get_spec_cache():
+    return SpecCache(SPEC_CACHE_BYTES)
+
+# 日銀→銀行の連動モデルは、データの版ごとに1回だけ推定して全セッションで使い回します
+@st.cache_resource(max_entries=4)
+def get_pass_through_fit(version, _snapshot):
+    policy = next(s for s in get_refresher().fetcher.series if s.policy)
+    banks = [c for c in _snapshot.df.columns if c not in ('Date', policy.label)]
+    return fit_pass_through(_snapshot.events, policy.label, banks)
+
+# 店頭金利の将来パスも同じく覚えておき、優遇幅を動かしたときはパーセンタイルだけを計算し直します
+@st.cache_resource(max_entries=16)
+def get_store_paths(version, bank, months, n_paths, _fit):
+    paths = simulate_store_paths(_fit, bank, months, n_paths)
+    paths.flags.writeable = False
+    return paths
+
+def get_schedule(name, loan):
+    # 返済スケジュールはセッションごとに覚えておき、借入条件が変わったときだけ作り直します
+    schedules = st.session_state.setdefault("schedules", {})
+    schedule = schedules.get(name)
+    if schedule is None or schedule.loan != loan:
+        schedule = schedules[name] = AmortizationSchedule(*loan)
+    return schedule
+
+def load_data():
+    # 描画は最後に取り込みが完了したデータを読むだけです
+    # (保存データも無い初回起動時だけ、最初の取り込みを待ちます)
+    refresher = get_refresher()
+    with timer.stage("load_data", cache="hit" if refresher.snapshot is not None else "miss") as rec:
+        snapshot = refresher.wait_snapshot(timeout=60)
+        rec['version'] = snapshot.version if snapshot is not None else None
+    if snapshot is None or snapshot.df.empty: return None
+    return snapshot
+
+snapshot = load_data()
+get_api_server()
+df = snapshot.df if snapshot is not None else None
 
 # --- サイドバー設定 ---
 st.sidebar.header("⚙️ 設定")
 
 if st.sidebar.button("🔄 データを強制更新"):
-    st.cache_data.clear()
-    st.rerun()
+    # 裏で取り込みを始めるだけなので、画面はそのまま使えます
+    get_refresher().request_refresh()
+    st.sidebar.caption("更新をリクエストしました。取り込みが終わると次の操作から反映されます。")
+
+# 日付や金利が読めずに捨てた行があればお知らせします（残りの行はそのまま使います）
+if snapshot is not None and snapshot.rejected_rows:
+    st.sidebar.warning(f"⚠️ 読み込めない行が {snapshot.rejected_rows:,} 件あったため除外しました。")
 
 st.sidebar.divider()
 
 if df is not None and not df.empty:
     st.sidebar.subheader("💰 My金利シミュレーション")
     
-    # ★デフォルトを「横浜」に変更
-    # リストの順番を変えて、横浜を一番上にしました
-    bank_options = ["横浜", "UFJ", "城北"]
+    # 選択肢はソースに登録された銀行（日銀以外）のうち、データが届いているものから作ります
+    # ★デフォルトは「横浜」
+    rate_series = [s for s in get_refresher().fetcher.series if s.label in df.columns]
+    bank_options = [s.label for s in rate_series if not s.policy]
     
     my_bank = st.sidebar.selectbox(
         "借りている銀行",
         bank_options,
-        index=0  # 0番目（つまり横浜）をデフォルトにする
+        index=bank_options.index(DEFAULT_BANK) if DEFAULT_BANK in bank_options else 0
     )
 
     # 優遇幅
     discount_rate = st.sidebar.number_input(
         "優遇幅 (マイナス分 %)",
-        min_value=0.0, max_value=3.0, value=1.85, step=0.01, format="%.2f"
+        min_value=0.0, max_value=3.0, value=DEFAULT_DISCOUNT, step=0.01, format="%.2f"
     )
     
     st.sidebar.caption(f"適用金利 = {my_bank}店頭 - {discount_rate}%")
 
-# --- メイン画面 ---
-st.title("🏦 My金利ウォッチ (Pro)")
+# --- 画面の部品（フラグメント） ---
+# 部品ごとに st.fragment にしてあり、部品の中のウィジェットを動かしたときはその部品だけを再実行します
+# (期間（足）はチャート、シナリオ数などは返済シミュレーション、表示件数などは履歴だけが再実行されます)。
+# 引数が部品の入力で、部品だけの再実行では前回のページ全体の実行で渡した値がそのまま使われます。
+# 銀行と優遇幅はすべての部品が使うので、変えたときはページ全体を再実行します。
+def timed_fragment(func):
+    """st.fragment に、部品ごとの処理時間の記録を足したデコレーター
 
-if df is None or df.empty:
-    st.error("⚠️ データが読み込めませんでした。URLを確認してください。")
-else:
-    df_sorted = df.sort_values('Date')
-    latest = df_sorted.iloc[-1]
-    
-    # My金利計算
-    current_store_rate = latest[my_bank]
-    my_real_rate = max(0, current_store_rate - discount_rate)
+    部品だけが再実行されたときは、その実行用の RunTimer を作り、部品名を付けて1行のログに出します。
+    """
+    @st.fragment
+    @functools.wraps(func)
+    def run(snapshot, *args):
+        global timer
+        full_run = st.session_state.get("full_run", False)
+        if not full_run:
+            timer = RunTimer(trace_memory=st.session_state.get("debug_panel", False))
+        with timer.stage(f"fragment:{func.__name__}"):
+            func(snapshot, *args)
+        if not full_run:
+            timer.log(fragment=func.__name__, version=snapshot.version)
+    return run
 
+@timed_fragment
+def show_metrics(snapshot, rate_series, my_bank, discount_rate):
     # --- 1. 最新ステータス (日本語表記) ---
+    latest = snapshot.df.iloc[-1]
+    current_store_rate = latest[my_bank]
+    my_real_rate = effective_rate(current_store_rate, discount_rate)
+
     st.markdown(f"### 📊 現在の金利状況 ({latest['Date'].strftime('%Y/%m/%d')} 時点)")
     
     col1, col2, col3, col4 = st.columns(4)
@@ -83,68 +170,293 @@ else:
     col1.metric("🏠 あなたの金利", f"{my_real_rate:.3f}%", delta_color="inverse")
     
     # 各銀行のレート（日本語列名でアクセス）
-    col2.metric("日銀 (政策)", f"{latest['日銀']}%")
+    policy = next(s for s in rate_series if s.policy)
+    col2.metric(f"{policy.label} (政策)", f"{latest[policy.label]}%")
     col3.metric(f"{my_bank} (店頭)", f"{current_store_rate}%")
     
-    # 他行平均の計算も日本語列名で
-    avg_rate = (latest['UFJ'] + latest['横浜']) / 2
+    # 大手平均は major の印が付いた銀行の平均
+    avg_rate = latest[[s.label for s in rate_series if s.major]].mean()
     col4.metric("大手平均", f"{avg_rate:.2f}%")
 
     st.divider()
 
+@timed_fragment
+def show_chart(snapshot, my_bank, discount_rate):
     # --- 2. チャート ---
     st.sidebar.divider()
     st.sidebar.header("📈 チャート設定")
-    timeframe = st.sidebar.radio("期間（足）", ["分足", "日足", "週足", "年足"], index=1)
-
-    # データ加工
-    df_indexed = df_sorted.set_index('Date')
-    df_chart_source = df_indexed.copy()
-    
-    if "週足" in timeframe:
-        df_display = df_chart_source.resample('W').last().reset_index()
-    elif "年足" in timeframe:
-        df_display = df_chart_source.resample('A').last().reset_index()
-    elif "分足" in timeframe:
-        df_display = df_sorted.copy()
-    else:
-        df_display = df_chart_source.resample('D').last().dropna().reset_index()
-
-    # My金利データの作成
-    chart_data = df_display.melt('Date', var_name='Bank', value_name='Rate')
-    
-    my_rate_data = df_display[['Date', my_bank]].copy()
-    my_rate_data['Rate'] = my_rate_data[my_bank] - discount_rate
-    my_rate_data['Rate'] = my_rate_data['Rate'].apply(lambda x: max(0, x))
-    my_rate_data['Bank'] = "★My金利"
-    
-    final_chart_data = pd.concat([chart_data, my_rate_data[['Date', 'Bank', 'Rate']]])
+    timeframe = st.sidebar.radio("期間（足）", list(TIMEFRAMES), index=1)
 
     st.subheader(f"📈 金利推移チャート")
     
     # チャート描画（凡例も自動的に日本語になります）
-    base = alt.Chart(final_chart_data).encode(
-        x=alt.X('Date:T', title='日付'),
-        y=alt.Y('Rate:Q', title='金利 (%)'),
-        tooltip=['Date', 'Bank', 'Rate']
-    )
+    # (足ごとのリサンプルは取り込み時に済んでいて、組み立てた spec も
+    #  データの版・足・銀行・優遇幅の組ごとに覚えておくので、同じ表示なら作り直しません)
+    # (足ごとの集計は取り込み時に作った時間を、リサンプルの段階として記録します)
+    timer.records.append({
+        'stage': 'resample', 'ms': snapshot.build_ms, 'per': 'version',
+        'rows': len(snapshot.frames[timeframe]),
+    })
+    with timer.stage("chart_build", timeframe=timeframe) as rec:
+        chart = get_spec_cache().get_or_build(
+            (snapshot.version, timeframe, my_bank, round(discount_rate, 4)),
+            lambda: rate_chart_spec(snapshot.frames[timeframe], my_bank, discount_rate, CHART_MAX_POINTS),
+        )
+        rec['cache'] = "hit" if chart.hit else "miss"
+        rec['spec_bytes'] = chart.size
+    with timer.stage("chart_render"):
+        st.vega_lite_chart(chart.spec, width="stretch")
+
+@timed_fragment
+def show_forecast(snapshot, my_bank, discount_rate):
+    # 日銀の変更に銀行がどれだけ連動してきたかを履歴から推定し、この先の My金利 の幅を描きます
+    forecast = st.expander("🔮 My金利の予測（日銀との連動から）", key="forecast_open", on_change="rerun")
+    if forecast.open:
+        with forecast:
+            fcol1, fcol2 = st.columns(2)
+            horizon_years = fcol1.slider("予測する期間 (年)", min_value=1, max_value=10, value=5)
+            n_paths = fcol2.select_slider("パス数", [1000, 2000, 5000, 10000], value=5000)
 
-    lines = base.mark_line(interpolate='step-after', point=True).encode(
-        color=alt.Color('Bank:N', title='銀行名'), # 凡例タイトル
-        strokeDash=alt.condition(
-            alt.datum.Bank == '★My金利',
-            alt.value([0]),
-            alt.value([4, 2])
-        ),
-        strokeWidth=alt.condition(
-            alt.datum.Bank == '★My金利',
-            alt.value(4),
-            alt.value(1.5)
+            with timer.stage("forecast", paths=n_paths) as rec:
+                fit = get_pass_through_fit(snapshot.version, snapshot)
+                store_paths = get_store_paths(snapshot.version, my_bank, horizon_years * 12, n_paths, fit)
+                bands = forecast_bands(fit, my_bank, discount_rate, store_paths=store_paths)
+                # 直近3年の My金利 を予測の手前に並べます
+                daily = snapshot.frames["日足"]
+                recent = daily[daily['Date'] >= fit.last_date - pd.DateOffset(years=3)]
+                recent = downsample_steps(recent, [my_bank], CHART_MAX_POINTS)
+                past = recent[['Date']].assign(Rate=my_rate_series(recent, my_bank, discount_rate))
+                rec['bank'] = my_bank
+
+            bank_fit = fit.banks[my_bank]
+            fcol3, fcol4, fcol5 = st.columns(3)
+            fcol3.metric(f"{horizon_years}年後の My金利 (中央値)", f"{bands['p50'].iloc[-1]:.3f}%")
+            fcol4.metric(f"{horizon_years}年後 (5〜95%)", f"{bands['p5'].iloc[-1]:.3f}〜{bands['p95'].iloc[-1]:.3f}%")
+            fcol5.metric(f"{my_bank}の連動率", f"{bank_fit.beta:.2f}")
+            st.altair_chart(build_forecast_chart(past, bands), width="stretch")
+            st.caption(
+                f"日銀の変更 {len(fit.policy_moves)} 回（年 {fit.events_per_year:.2f} 回）と、"
+                f"そのときの{my_bank}の動き {bank_fit.n_events} 回から推定。"
+                f"{n_paths:,} 通りのパスで計算し、帯は 5〜95% と 25〜75% の範囲です。"
+            )
+
+@timed_fragment
+def show_simulator(snapshot, my_bank, discount_rate):
+    # --- 3. 返済シミュレーション ---
+    # 今の店頭金利から金利シナリオをたくさん作り、返済額と利息の分布を全シナリオまとめて計算します
+    current_store_rate = snapshot.df[my_bank].iloc[-1]
+    simulator = st.expander("🧮 返済シミュレーション", key="simulator_open", on_change="rerun")
+    if simulator.open:
+        with simulator:
+            scol1, scol2, scol3 = st.columns(3)
+            principal_man = scol1.number_input("借入額 (万円)", min_value=100, max_value=30000, value=3000, step=100)
+            years = scol2.number_input("返済期間 (年)", min_value=1, max_value=50, value=35, step=1)
+            method = scol3.radio("返済方法", REPAYMENT_METHODS, horizontal=True)
+
+            scol4, scol5, scol6 = st.columns(3)
+            annual_drift = scol4.number_input("店頭金利の上昇ペース (%/年)", min_value=-1.0, max_value=1.0, value=0.05, step=0.01, format="%.2f")
+            annual_vol = scol5.number_input("金利の振れ幅 (%/年)", min_value=0.0, max_value=2.0, value=0.3, step=0.05, format="%.2f")
+            n_scenarios = scol6.select_slider("シナリオ数", [100, 500, 1000, 2000, 5000, 10000], value=2000)
+
+            five_year_rule = st.checkbox("5年ルール（返済額は5年ごとに見直し）", value=True, disabled=method != ANNUITY)
+            cap_125 = st.checkbox("125%ルール（見直し後の返済額は1.25倍まで）", value=True, disabled=method != ANNUITY or not five_year_rule)
+
+            loan = (principal_man * 10_000, years, method, five_year_rule, cap_125)
+            n_months = years * 12
+            with timer.stage("simulator", scenarios=n_scenarios):
+                rate_paths = store_rate_scenarios(
+                    current_store_rate, discount_rate, n_months, n_scenarios,
+                    annual_vol=annual_vol, annual_drift=annual_drift,
+                )
+                result = simulate_repayment(
+                    loan[0], years, rate_paths, method=method, five_year_rule=five_year_rule, cap_125=cap_125
+                )
+                interest = np.percentile(result.total_interest, [5, 50, 95])
+                balloon_95 = np.percentile(result.final_balloon, 95)
+
+            mcol1, mcol2, mcol3, mcol4 = st.columns(4)
+            mcol1.metric("初回の返済額 (月)", f"{result.payments[0, 0]:,.0f} 円")
+            mcol2.metric("利息総額 (中央値)", f"{interest[1] / 10_000:,.0f} 万円")
+            mcol3.metric("利息総額 (5〜95%)", f"{interest[0] / 10_000:,.0f}〜{interest[2] / 10_000:,.0f} 万円")
+            mcol4.metric("最終回の一括精算 (95%)", f"{balloon_95 / 10_000:,.0f} 万円")
+
+            bands = pd.DataFrame(result.payment_bands().T, columns=[f"p{p}" for p in PERCENTILES])
+            bands.insert(0, "年", np.arange(1, bands.shape[0] + 1) / 12)
+            st.altair_chart(build_band_chart(bands, "年:Q", "経過年数", "毎月の返済額 (円)"), width="stretch")
+            st.caption(f"{n_scenarios:,} 通りの金利シナリオ（半年ごとの見直し）で計算。帯は 5〜95% と 25〜75% の範囲です。")
+
+            # 金利が1回だけ変わる場合の返済予定
+            # (スケジュールはセッションごとに覚えておき、優遇幅や変化のタイミングを動かしても
+            #  金利が変わった月から先だけを計算し直します)
+            st.markdown("##### 📅 金利が変わったときの返済予定")
+            pcol1, pcol2 = st.columns(2)
+            shift_year = pcol1.slider("何年後に", min_value=0, max_value=int(years), value=min(5, int(years)))
+            shift_size = pcol2.slider("店頭金利がどれだけ動くか (%)", min_value=-2.0, max_value=3.0, value=0.5, step=0.05)
+            with timer.stage("projection") as rec:
+                store_path = np.full(n_months, current_store_rate)
+                store_path[(shift_year * 12):] += shift_size
+                projection = get_schedule("projection", loan)
+                planned = projection.update(effective_rate(store_path, discount_rate))
+                rec['from_month'] = projection.last_start
+            pcol3, pcol4, pcol5 = st.columns(3)
+            pcol3.metric("変化後の返済額 (月)", f"{planned.payments[0, min(shift_year * 12, n_months - 1)]:,.0f} 円")
+            pcol4.metric("利息総額", f"{planned.total_interest[0] / 10_000:,.0f} 万円")
+            pcol5.metric("最終回の一括精算", f"{planned.final_balloon[0] / 10_000:,.0f} 万円")
+
+@timed_fragment
+def show_history(snapshot, rate_series, my_bank, discount_rate):
+    # --- 4. 履歴リスト ---
+    # 開いているときだけ中身を作り、表示するページの行だけをブラウザに送ります
+    history = st.expander("詳細データを見る", key="history_open", on_change="rerun")
+    if history.open:
+        with history:
+            first_day = snapshot.df['Date'].iloc[0].date()
+            last_day = snapshot.df['Date'].iloc[-1].date()
+
+            database = get_database()
+            if database is not None:
+                rows_mode = st.radio(
+                    "表示する行", ["変更時点のみ", "全サンプル"], horizontal=True,
+                    help="全サンプルは保存データから期間とページを絞り込んで読みます",
+                )
+            else:
+                rows_mode = "変更時点のみ"
+
+            hcol1, hcol2, hcol3 = st.columns([2, 1, 1])
+            date_range = hcol1.date_input(
+                "期間", value=(first_day, last_day), min_value=first_day, max_value=last_day
+            )
+            # 期間の終わりを選んでいる途中は開始日だけが返ってきます
+            start_day, end_day = (tuple(date_range) + (last_day,))[:2]
+            page_size = hcol2.selectbox("表示件数", [50, 100, 500, 1000], index=1)
+
+            if rows_mode == "全サンプル":
+                # 期間の絞り込み・件数・ページの切り出しは SQL で行います
+                range_start = pd.Timestamp(start_day)
+                range_end = pd.Timestamp(end_day) + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')
+                with timer.stage("db_count"):
+                    lo, hi = 0, database.count(range_start, range_end)
+            else:
+                lo, hi = date_range_slice(snapshot.df['Date'], start_day, end_day)
+            n_pages = max(1, -(-(hi - lo) // page_size))
+            page = hcol3.number_input("ページ", min_value=1, max_value=n_pages, value=1, step=1)
+
+            # 指定した日の終わりの時点の金利（変更の索引を二分探索して引くので、履歴の長さによらず一瞬です）
+            qcol1, *qcols = st.columns(len(rate_series) + 2)
+            query_day = qcol1.date_input("指定日の金利", value=last_day, min_value=first_day, max_value=last_day)
+            with timer.stage("asof"):
+                day_end = pd.Timestamp(query_day) + pd.Timedelta(days=1) - pd.Timedelta(1, 'us')
+                rates_then = snapshot.events.asof(day_end, [s.label for s in rate_series]).iloc[0]
+            for qcol, s in zip(qcols, rate_series):
+                qcol.metric(s.label, f"{rates_then[s.label]}%")
+            qcols[-1].metric("あなたの金利", f"{effective_rate(rates_then[my_bank], discount_rate):.3f}%")
+
+            if rows_mode == "全サンプル":
+                with timer.stage("db_samples", rows=min(page_size, hi - lo)):
+                    rows = database.samples(
+                        range_start, range_end, labels=[s.label for s in rate_series],
+                        limit=page_size, offset=(page - 1) * page_size, newest_first=True,
+                    )
+                with timer.stage("dataframe", rows=len(rows)):
+                    st.dataframe(rows.set_index('Date'))
+                st.caption(f"{hi - lo:,} 件中 {page} / {n_pages} ページ（新しい順・全サンプル）")
+            else:
+                with timer.stage("dataframe", rows=min(page_size, hi - lo)):
+                    st.dataframe(history_page(snapshot.df, lo, hi, page - 1, page_size))
+                st.caption(f"{hi - lo:,} 件中 {page} / {n_pages} ページ（新しい順・どれかの金利が変わった日時だけ）")
+
+@timed_fragment
+def show_portfolio(snapshot):
+    # --- 6. ポートフォリオ ---
+    # お客様のローン一覧を読み込み、全ローンの金利と返済額を共有の金利履歴から1回でまとめて計算します
+    portfolio = st.expander("📂 ポートフォリオ（複数のローン）", key="portfolio_open", on_change="rerun")
+    if not portfolio.open:
+        return
+    with portfolio:
+        uploaded = st.file_uploader(
+            f"ローン一覧の CSV（列: {', '.join(LOAN_COLUMNS.values())}）", type="csv"
         )
-    ).interactive()
+        source = uploaded.getvalue() if uploaded is not None else PORTFOLIO_PATH
+        if source is None:
+            st.caption("ファイルを選ぶと、全ローンの今の金利・残高・毎月の返済額を計算します。")
+            return
+        try:
+            loans, rejected = read_loans(source)
+        except (OSError, ValueError) as e:
+            st.error(f"⚠️ ローン一覧が読み込めませんでした: {e}")
+            return
 
-    st.altair_chart(lines, use_container_width=True)
-    
-    # --- 3. 履歴リスト ---
-    with st.expander("詳細データを見る"):
-        st.dataframe(df_sorted.set_index('Date').sort_index(ascending=False))
+        with timer.stage("portfolio", loans=len(loans)):
+            result = price_portfolio(loans, snapshot.events)
+            priced = result.priced
+            exposure = result.exposure()
+
+        total = priced['balance'].sum()
+        pcol1, pcol2, pcol3, pcol4 = st.columns(4)
+        pcol1.metric("ローン件数", f"{len(priced):,} 件")
+        pcol2.metric("残高合計", f"{total / 100_000_000:,.2f} 億円")
+        pcol3.metric("加重平均の金利", f"{(priced['balance'] * priced['rate_now']).sum() / total:.3f}%" if total else "-")
+        pcol4.metric("毎月の返済額の合計", f"{priced['payment_now'].sum() / 10_000:,.0f} 万円")
+        if rejected or result.unknown:
+            st.warning(f"⚠️ 読み込めない行 {rejected:,} 件と、金利の履歴が無い銀行のローン {result.unknown:,} 件は除外しました。")
+
+        st.markdown("##### 🏦 銀行ごとの残高")
+        st.dataframe(
+            exposure, hide_index=True,
+            column_config={
+                "bank": "銀行", "loans": "件数",
+                "balance": st.column_config.NumberColumn("残高 (円)", format="localized"),
+                "payment": st.column_config.NumberColumn("毎月の返済額 (円)", format="localized"),
+                "rate_now": st.column_config.NumberColumn("加重平均の金利 (%)", format="%.3f"),
+            },
+        )
+        # 見出しをクリックすると並べ替えられます
+        st.markdown("##### 📋 ローンごとの金利")
+        st.dataframe(
+            result.loans, hide_index=True,
+            column_config={
+                "bank": "銀行",
+                "discount": st.column_config.NumberColumn("優遇幅 (%)", format="%.2f"),
+                "principal": st.column_config.NumberColumn("借入額 (円)", format="localized"),
+                "term": "期間 (年)",
+                "start": st.column_config.DateColumn("借入日"),
+                "rate_start": st.column_config.NumberColumn("借入時の金利 (%)", format="%.3f"),
+                "rate_now": st.column_config.NumberColumn("今の金利 (%)", format="%.3f"),
+                "rate_change": st.column_config.NumberColumn("変化 (%)", format="%+.3f"),
+                "months_paid": "返済済み (月)",
+                "months_left": "残り (月)",
+                "balance": st.column_config.NumberColumn("残高 (円)", format="localized"),
+                "payment_now": st.column_config.NumberColumn("今の返済額 (月・円)", format="localized"),
+                "interest_paid": st.column_config.NumberColumn("支払済みの利息 (円)", format="localized"),
+            },
+        )
+        st.caption(
+            f"{result.as_of.strftime('%Y/%m/%d')} 時点。元利均等で、毎月その月の金利で返済額を見直すものとして計算しています。"
+        )
+
+# --- メイン画面 ---
+st.title("🏦 My金利ウォッチ (Pro)")
+
+if df is None or df.empty:
+    st.error("⚠️ データが読み込めませんでした。URLを確認してください。")
+else:
+    # 並べ替えと金利変更の抽出は取り込み時に済んでいます
+    # (snapshot.df は変更の索引から作った「どれかの金利が変わった日時だけ」の表で、最後の行が今の金利です。
+    #  全セッションで共有している読み取り専用のスナップショットなので、コピーも変更もしません)
+    show_metrics(snapshot, rate_series, my_bank, discount_rate)
+    show_chart(snapshot, my_bank, discount_rate)
+    show_forecast(snapshot, my_bank, discount_rate)
+    show_simulator(snapshot, my_bank, discount_rate)
+    show_history(snapshot, rate_series, my_bank, discount_rate)
+    show_portfolio(snapshot)
+
+# --- 5. 計測パネル（デバッグ用） ---
+st.sidebar.divider()
+if st.sidebar.toggle("🐞 計測パネルを表示", key="debug_panel"):
+    st.sidebar.caption(f"今回の実行: 合計 {timer.total_ms():.1f} ms")
+    if snapshot is not None:
+        st.sidebar.caption(f"共有スナップショット: {snapshot.nbytes / 1024 / 1024:.1f} MB（全セッションで1つ）")
+        st.sidebar.caption(f"金利の変更 {snapshot.events.n_events:,} 件（取り込んだサンプル {snapshot.sampled_rows:,} 行）")
+    st.sidebar.dataframe(timer.records, hide_index=True)
+timer.log(version=snapshot.version if snapshot is not None else None)
+st.session_state["full_run"] = False
@@ -0,0 +1,246 @@
+"""My金利ウォッチの読み取り専用 HTTP API（画面をスクレイピングせずに金利を取れるようにする）
+
+    GET /latest                                  今の全系列の金利
+    GET /series?tf=日足&bank=横浜&discount=1.85     期間（足）ごとの金利の推移 (start / end でも絞り込めます)
+    GET /myrate?bank=横浜&discount=1.85            店頭金利と My金利 (at でその日時の金利)
+
+どれも ?format=csv で CSV、省略時は JSON で返します。応答には中身のハッシュの ETag と
+Cache-Control が付くので、If-None-Match を送ってくるクライアントには、データが変わるまで
+本文なしの 304 だけを返します。
+
+画面(kinri.py)と同じプロセスで動かすと、画面と同じ取り込み済みのデータ(スナップショット)を使います。
+単独で動かすときは自分で取り込みます:
+
+    python kinri_api.py --port 8502
+"""
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from kinri_data import TIMEFRAMES, RateRefresher
+from kinri_engine import (
+    CSV_URL, DEFAULT_BANK, DEFAULT_DISCOUNT, STORE_DIR, latest_rates, make_sources, my_rate, rate_series, write_frame,
+)
+from kinri_sources import MultiSourceFetcher
+
+logger = logging.getLogger("kinri.api")
+
+# ==========================================
+# API の待ち受け先（画面と一緒に起動します。KINRI_API_PORT を空にすると起動しません）
+# (ほかのマシンから使うときは KINRI_API_HOST=0.0.0.0 にします)
+API_HOST = os.environ.get("KINRI_API_HOST", "127.0.0.1")
+API_PORT = os.environ.get("KINRI_API_PORT", "8502")
+# クライアントが問い合わせずに使い回してよい秒数（過ぎたら ETag で確認してもらいます）
+API_MAX_AGE = 60
+# ==========================================
+
+# 足の指定は日本語名でも pandas の記号でもよい
+TIMEFRAME_ALIASES = {**{name: name for name in TIMEFRAMES}, **{rule or 'min': name for name, rule in TIMEFRAMES.items()}}
+CONTENT_TYPES = {
+    'json': 'application/json; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _one(query, name, default=None):
+    values = query.get(name)
+    return values[-1] if values else default
+
+
+def _float(query, name, default):
+    value = _one(query, name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} は数値で指定してください: {value}") from None
+
+
+def _latest(snapshot, query):
+    return latest_rates(snapshot)
+
+
+def _series(snapshot, query):
+    tf = _one(query, 'tf', '日足')
+    if tf not in TIMEFRAME_ALIASES:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"tf は {', '.join(TIMEFRAMES)} のどれかです: {tf}")
+    bank = _one(query, 'bank')
+    discount = _float(query, 'discount', DEFAULT_DISCOUNT)
+    return rate_series(snapshot, TIMEFRAME_ALIASES[tf], bank, discount, _one(query, 'start'), _one(query, 'end'))
+
+
+def _myrate(snapshot, query):
+    bank = _one(query, 'bank', DEFAULT_BANK)
+    return my_rate(snapshot, bank, _float(query, 'discount', DEFAULT_DISCOUNT), _one(query, 'at'))
+
+
+ENDPOINTS = {
+    '/latest': _latest,
+    '/series': _series,
+    '/myrate': _myrate,
+}
+
+
+class RateApi:
+    """HTTP に依らない API の本体。パスとクエリから (状態, ヘッダー, 本文) を作る
+
+    get_snapshot は今のスナップショット(まだ無ければ None)を返す関数です。
+    応答の本文と ETag はデータの版ごとに覚えておくので、同じ問い合わせが続いても
+    計算と直列化は版が変わったときの1回だけで済みます。
+    """
+
+    def __init__(self, get_snapshot, max_age=API_MAX_AGE, max_entries=256):
+        self.get_snapshot = get_snapshot
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._version = None
+        self._responses = {}  # (パス, クエリ) → (ETag, Content-Type, 本文)
+
+    def handle(self, target, if_none_match=None):
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        snapshot = self.get_snapshot()
+        try:
+            if url.path not in ENDPOINTS:
+                raise ApiError(HTTPStatus.NOT_FOUND, f"{url.path} はありません ({', '.join(ENDPOINTS)})")
+            if snapshot is None:
+                raise ApiError(HTTPStatus.SERVICE_UNAVAILABLE, "データを読み込み中です")
+            etag, content_type, body = self._response(snapshot, url.path, query)
+        except ApiError as e:
+            return _error(e.status, str(e))
+        except Exception:
+            # 思わぬ失敗でも応答なしで接続を切らず、500 を返す(原因はログに残す)
+            logger.exception("%s の応答を作れませんでした", target)
+            return _error(HTTPStatus.INTERNAL_SERVER_ERROR, "応答を作れませんでした")
+
+        headers = {'ETag': etag, 'Cache-Control': f"public, max-age={self.max_age}"}
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return HTTPStatus.NOT_MODIFIED, headers, b''
+        return HTTPStatus.OK, {**headers, 'Content-Type': content_type}, body
+
+    def _response(self, snapshot, path, query):
+        key = (path, tuple(sorted((name, tuple(values)) for name, values in query.items())))
+        with self._lock:
+            if self._version != snapshot.version:
+                self._version = snapshot.version
+                self._responses.clear()
+            cached = self._responses.get(key)
+        if cached is not None:
+            return cached
+
+        fmt = _one(query, 'format', 'json')
+        if fmt not in CONTENT_TYPES:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"format は {', '.join(CONTENT_TYPES)} のどちらかです: {fmt}")
+        try:
+            frame = ENDPOINTS[path](snapshot, query)
+        except KeyError as e:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"その銀行はデータにありません: {e}") from None
+        except ValueError as e:
+            raise ApiError(HTTPStatus.BAD_REQUEST, str(e)) from None
+        out = io.StringIO()
+        write_frame(frame, fmt, out)
+        body = out.getvalue().encode()
+        response = (f'"{hashlib.sha256(body).hexdigest()[:32]}"', CONTENT_TYPES[fmt], body)
+
+        with self._lock:
+            if self._version == snapshot.version:
+                if len(self._responses) >= self.max_entries:
+                    self._responses.clear()
+                self._responses[key] = response
+        return response
+
+
+def _error(status, message):
+    body = json.dumps({'error': message}, ensure_ascii=False).encode()
+    return status, {'Content-Type': CONTENT_TYPES['json'], 'Cache-Control': 'no-store'}, body
+
+
+def _etag_matches(if_none_match, etag):
+    if if_none_match.strip() == '*':
+        return True
+    # 弱い比較(W/ は無視する)。カンマ区切りで複数並んでいてもよい
+    tags = (tag.strip() for tag in if_none_match.split(','))
+    return etag in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    api = None  # RateApi。make_server で差し込む
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body):
+        status, headers, body = self.api.handle(self.path, self.headers.get('If-None-Match'))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status != HTTPStatus.NOT_MODIFIED:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body and body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+def make_server(get_snapshot, host=API_HOST, port=API_PORT, max_age=API_MAX_AGE):
+    """API のサーバーを作る(まだ待ち受けは始めない)。リクエストごとにスレッドで応答します"""
+    handler = type('Handler', (ApiRequestHandler,), {'api': RateApi(get_snapshot, max_age)})
+    server = ThreadingHTTPServer((host, int(port)), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(get_snapshot, host=API_HOST, port=API_PORT, max_age=API_MAX_AGE):
+    """API のサーバーを裏のスレッドで動かし始める。ポートを使えなければ None"""
+    try:
+        server = make_server(get_snapshot, host, port, max_age)
+    except OSError as e:
+        logger.warning("API を %s:%s で起動できませんでした: %s", host, port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="kinri-api", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=CSV_URL, help='金利CSVのURL')
+    parser.add_argument('--store-dir', default=STORE_DIR, help='取り込んだ履歴の保存先フォルダ')
+    parser.add_argument('--host', default=API_HOST, help='待ち受けるアドレス')
+    parser.add_argument('--port', type=int, default=int(API_PORT or 8502), help='待ち受けるポート')
+    parser.add_argument('--interval', type=int, default=600, help='取り込みの間隔(秒)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    refresher = RateRefresher(MultiSourceFetcher(make_sources(args.url, args.store_dir)), args.interval).start()
+    server = make_server(lambda: refresher.snapshot, args.host, args.port)
+    logger.info("http://%s:%s/latest で待ち受けています", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
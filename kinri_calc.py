@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+
+def effective_rate(store_rate, discount):
+    """店頭金利から優遇幅を引いた適用金利（0%未満にはならない）
+
+    スカラーでも Series / ndarray でも同じ計算を NumPy でまとめて行うので、
+    メトリクスの1件とチャートの全行で結果が食い違うことはありません。
+    店頭金利が欠損(NaN)の期間は、適用金利も欠損のままにします。
+    """
+    return np.maximum(store_rate - discount, 0.0)
+
+
+def my_rate_series(frame, bank, discount):
+    """frame の銀行列から My金利 の系列を作る"""
+    return effective_rate(frame[bank], discount).rename('Rate')
+
+
+def change_point_mask(values):
+    """値がひとつ前の行から変わった行を True にする（最初と最後の行は必ず残す）
+
+    values は (行数, 系列数) の配列。どれか1系列でも変われば、その行を残します。
+    金利は階段状にしか動かないので、これだけで step-after の線は元と同じ形になります。
+    """
+    n = len(values)
+    mask = np.zeros(n, dtype=bool)
+    if n == 0:
+        return mask
+    prev, curr = values[:-1], values[1:]
+    # NaN 同士は「変化なし」とみなす
+    changed = (prev != curr) & ~(np.isnan(prev) & np.isnan(curr))
+    mask[1:] = changed.any(axis=1)
+    mask[0] = mask[-1] = True
+    return mask
+
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets で、形を保ったまま threshold 点まで間引く位置を返す"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        # 次のバケットの平均点
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_start = end if end < next_end else n - 1
+        avg_x = x[next_start:next_end].mean() if next_end > next_start else x[-1]
+        avg_y = y[next_start:next_end].mean() if next_end > next_start else y[-1]
+        # 前に選んだ点・次のバケットの平均点と作る三角形が最大になる点を選ぶ
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_steps(frame, columns, max_points=None):
+    """チャートに渡す前に、描画結果が変わらない範囲で行を間引く
+
+    まず変化点だけを残し、それでも max_points 行を超えるときは
+    系列ごとに LTTB で間引いた位置の和集合を残します。
+    """
+    values = frame[columns].to_numpy(dtype=float)
+    keep = np.flatnonzero(change_point_mask(values))
+
+    if max_points is not None and len(keep) > max_points:
+        x = frame['Date'].to_numpy()[keep].astype('datetime64[ns]').astype(np.int64).astype(float)
+        per_series = max(3, max_points // len(columns))
+        picked = set()
+        for j in range(len(columns)):
+            # LTTB の面積計算に NaN が混ざらないよう、直前の値で埋めておく
+            y = frame[columns[j]].iloc[keep].ffill().fillna(0).to_numpy(dtype=float)
+            picked.update(keep[lttb_indices(x, y, per_series)].tolist())
+        keep = np.array(sorted(picked), dtype=np.int64)
+
+    return frame.iloc[keep]
+
+
+def date_range_slice(dates, start, end):
+    """昇順に並んだ日付で、start日〜end日に入る行の位置 [lo, hi) を二分探索で求める"""
+    lo = dates.searchsorted(pd.Timestamp(start), side='left')
+    hi = dates.searchsorted(pd.Timestamp(end) + pd.Timedelta(days=1), side='left')
+    return int(lo), int(hi)
+
+
+def history_page(df_sorted, lo, hi, page, page_size):
+    """[lo, hi) の行を新しい順に並べたときの page ページ目(0始まり)だけを切り出す
+
+    並べ替えはせず、昇順のデータの末尾側から必要な分だけ取って逆順にします。
+    """
+    stop = max(lo, hi - page * page_size)
+    start = max(lo, stop - page_size)
+    return df_sorted.iloc[start:stop].iloc[::-1].set_index('Date')
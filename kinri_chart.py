@@ -0,0 +1,130 @@
+import json
+import threading
+from collections import OrderedDict, namedtuple
+
+import altair as alt
+
+from kinri_calc import downsample_steps, my_rate_series
+
+# チャート上の My金利 の系列名
+MY_RATE_LABEL = "★My金利"
+
+# SpecCache から返すもの（spec 本体、JSON にしたときのバイト数、キャッシュに当たったか）
+CachedSpec = namedtuple('CachedSpec', ['spec', 'size', 'hit'])
+
+
+def build_chart_source(df_display, my_bank, discount_rate):
+    """横持ち(日付×銀行)のまま My金利 の列を1本足したチャート用データを作る
+
+    縦持ちへの変換(melt)と連結(concat)はせず、Vega-Lite の fold 変換にブラウザ側でやってもらいます。
+    """
+    return df_display.assign(**{MY_RATE_LABEL: my_rate_series(df_display, my_bank, discount_rate)})
+
+
+def build_rate_chart(source):
+    """金利推移チャート（凡例は列名のまま日本語になります）"""
+    series = [c for c in source.columns if c != 'Date']
+
+    base = alt.Chart(source).transform_fold(
+        series, as_=['Bank', 'Rate']
+    ).encode(
+        x=alt.X('Date:T', title='日付'),
+        y=alt.Y('Rate:Q', title='金利 (%)'),
+        tooltip=['Date:T', 'Bank:N', 'Rate:Q']
+    )
+
+    return base.mark_line(interpolate='step-after', point=True).encode(
+        color=alt.Color('Bank:N', title='銀行名'), # 凡例タイトル
+        strokeDash=alt.condition(
+            alt.datum.Bank == MY_RATE_LABEL,
+            alt.value([0]),
+            alt.value([4, 2])
+        ),
+        strokeWidth=alt.condition(
+            alt.datum.Bank == MY_RATE_LABEL,
+            alt.value(4),
+            alt.value(1.5)
+        )
+    ).interactive()
+
+
+def rate_chart_spec(frame, my_bank, discount_rate, max_points=None):
+    """期間（足）の集計から、ブラウザに渡す Vega-Lite spec(dict) までを一気に作る"""
+    # 金利は階段状なので、値が変わった行だけ残してもチャートの見た目は変わりません
+    bank_columns = [c for c in frame.columns if c != 'Date']
+    df_display = downsample_steps(frame, bank_columns, max_points)
+    # My金利の列を足すだけで、縦持ちへの変換はチャート側(fold)でやります
+    source = build_chart_source(df_display, my_bank, discount_rate)
+    return build_rate_chart(source).to_dict()
+
+
+class SpecCache:
+    """組み立て済みの Vega-Lite spec を覚えておく LRU キャッシュ
+
+    キーは (データの版, 期間（足）, 銀行, 優遇幅) のように、spec の中身を決める値の組です。
+    JSON にしたときの合計バイト数が max_bytes を超えたら、古く使われたものから捨てます。
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (spec, バイト数)
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """キャッシュにあればそれを返し、無ければ build() で作って覚える(CachedSpec を返す)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return CachedSpec(*entry, hit=True)
+            self.misses += 1
+
+        # 組み立ては重いのでロックの外で行う(同じキーを同時に作っても結果は同じ)
+        spec = build()
+        size = len(json.dumps(spec, ensure_ascii=False).encode())
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (spec, size)
+                self.total_bytes += size
+            self._evict()
+        return CachedSpec(spec, size, hit=False)
+
+    def _evict(self):
+        # 直前に入れた1件だけは予算を超えていても残す
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+
+
+def build_band_chart(bands, x, x_title, y_title, color='#1f77b4'):
+    """パーセンタイルの帯（5-95% と 25-75%）と中央値の線を重ねたチャート
+
+    bands は x の列と p5, p25, p50, p75, p95 の列を持つ表です。
+    """
+    base = alt.Chart(bands).encode(x=alt.X(x, title=x_title))
+    outer = base.mark_area(opacity=0.15, color=color).encode(
+        y=alt.Y('p5:Q', title=y_title), y2='p95:Q'
+    )
+    inner = base.mark_area(opacity=0.3, color=color).encode(y='p25:Q', y2='p75:Q')
+    median = base.mark_line(color=color, strokeWidth=2).encode(
+        y='p50:Q',
+        tooltip=[alt.Tooltip(x), *[alt.Tooltip(f'{p}:Q', format=',.3~f') for p in ['p5', 'p50', 'p95']]]
+    )
+    return alt.layer(outer, inner, median)
+
+
+def build_forecast_chart(history, bands, color='#d62728'):
+    """これまでの My金利 (階段状の線) の先に、将来のパーセンタイルの帯をつなげたチャート
+
+    history は Date と Rate の列、bands は Date と p5〜p95 の列を持つ表です。
+    """
+    past = alt.Chart(history).mark_line(interpolate='step-after', color=color, strokeWidth=3).encode(
+        x=alt.X('Date:T', title='日付'),
+        y=alt.Y('Rate:Q', title='金利 (%)'),
+        tooltip=['Date:T', alt.Tooltip('Rate:Q', title=MY_RATE_LABEL)]
+    )
+    return alt.layer(past, build_band_chart(bands, 'Date:T', '日付', '金利 (%)', color=color)).interactive()
@@ -0,0 +1,132 @@
+"""My金利ウォッチをコマンドラインから使う（cron やテストから、Streamlit を起動せずに計算する）
+
+    python kinri_cli.py latest
+    python kinri_cli.py myrate --bank 横浜 --discount 1.85 --format json
+    python kinri_cli.py series --timeframe 日足 --bank 横浜 --start 2024-01-01 --out series.csv
+    python kinri_cli.py portfolio --loans loans.csv --format json
+    python kinri_cli.py --offline samples --start 2024-01-01 --end 2024-03-31 --limit 100
+
+--offline を付けると、ネットワークに取りに行かずに保存データだけを使います
+(取り込みに失敗したときも、保存データがあればそれを使います)。
+samples と --offline の latest は、履歴をメモリに読み込まずに保存データ(SQLite)へ直接問い合わせます。
+"""
+import argparse
+import sys
+
+from kinri_data import TIMEFRAMES
+from kinri_engine import (
+    CSV_URL, DEFAULT_BANK, DEFAULT_DISCOUNT, PORTFOLIO_PATH, STORE_DIR, latest_rates, load_snapshot, make_sources,
+    my_rate, open_database, rate_series, write_frame,
+)
+from kinri_portfolio import price_portfolio, read_loans
+from kinri_sources import MultiSourceFetcher
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=CSV_URL, help='金利CSVのURL')
+    parser.add_argument('--store-dir', default=STORE_DIR, help='取り込んだ履歴の保存先フォルダ')
+    parser.add_argument('--offline', action='store_true', help='保存データだけを使う')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    # 出力の指定はどのコマンドにも付けられる
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument('--format', choices=['csv', 'json'], default='csv', help='出力形式')
+    output.add_argument('--out', help='出力ファイル(省略時は標準出力)')
+
+    commands.add_parser('latest', parents=[output], help='今の全系列の金利')
+
+    myrate = commands.add_parser('myrate', parents=[output], help='店頭金利と My金利')
+    myrate.add_argument('--bank', default=DEFAULT_BANK, help='借りている銀行')
+    myrate.add_argument('--discount', type=float, default=DEFAULT_DISCOUNT, help='優遇幅 (%%)')
+    myrate.add_argument('--at', help='この日時の金利(省略時は最新)')
+
+    series = commands.add_parser('series', parents=[output], help='期間（足）ごとの金利の推移')
+    series.add_argument('--timeframe', choices=list(TIMEFRAMES), default='日足', help='期間（足）')
+    series.add_argument('--bank', help='My金利 の列も付けるときの銀行')
+    series.add_argument('--discount', type=float, default=DEFAULT_DISCOUNT, help='優遇幅 (%%)')
+    series.add_argument('--start', help='この日時から')
+    series.add_argument('--end', help='この日時まで')
+
+    portfolio = commands.add_parser('portfolio', parents=[output], help='ローン一覧の全ローンの金利と返済額')
+    portfolio.add_argument('--loans', default=PORTFOLIO_PATH, required=PORTFOLIO_PATH is None,
+                           help='ローン一覧の CSV (bank, discount, principal, term, start)')
+    portfolio.add_argument('--at', help='この日時の時点で計算する(省略時は最新)')
+
+    samples = commands.add_parser('samples', parents=[output], help='保存データのサンプル（期間で絞り込み・足ごとの集計）')
+    samples.add_argument('--timeframe', choices=[name for name, rule in TIMEFRAMES.items() if rule],
+                         help='足ごとに各区切りの最後の金利にまとめる(省略時は全サンプル)')
+    samples.add_argument('--start', help='この日時から')
+    samples.add_argument('--end', help='この日時まで')
+    samples.add_argument('--limit', type=int, help='最大の行数')
+    samples.add_argument('--offset', type=int, default=0, help='先頭から飛ばす行数')
+    samples.add_argument('--newest-first', action='store_true', help='新しい順に並べる')
+
+    args = parser.parse_args(argv)
+
+    # 保存データへ直接問い合わせられるものは、履歴を読み込まずに答える
+    database = open_database(args.store_dir)
+    if args.command == 'samples' or (args.command == 'latest' and args.offline and database is not None):
+        if database is None:
+            parser.exit(2, "samples は保存データ(SQLite)がある設定でだけ使えます。\n")
+        try:
+            if args.command == 'latest':
+                frame = database.latest()
+            elif args.timeframe:
+                frame = database.resample(TIMEFRAMES[args.timeframe], args.start, args.end)
+                if args.newest_first:
+                    frame = frame.iloc[::-1]
+                frame = frame.iloc[args.offset:][:args.limit]
+            else:
+                frame = database.samples(args.start, args.end, limit=args.limit, offset=args.offset,
+                                         newest_first=args.newest_first)
+        except ValueError as e:
+            parser.exit(2, f"指定が正しくありません: {e}\n")
+        if frame is None or frame.empty:
+            parser.exit(1, "保存データがありません。先に --offline を付けずに取り込んでください。\n")
+        write(frame, args)
+        return
+
+    fetcher = MultiSourceFetcher(make_sources(args.url, args.store_dir))
+    try:
+        snapshot = load_snapshot(fetcher, offline=args.offline)
+    except OSError as e:
+        parser.exit(1, f"データを取り込めませんでした: {e}\n")
+    if snapshot is None:
+        parser.exit(1, "データが読み込めませんでした。URL か保存先を確認してください。\n")
+
+    try:
+        if args.command == 'latest':
+            frame = latest_rates(snapshot)
+        elif args.command == 'myrate':
+            frame = my_rate(snapshot, args.bank, args.discount, args.at)
+        elif args.command == 'portfolio':
+            try:
+                loans, rejected = read_loans(args.loans)
+            except (OSError, ValueError) as e:
+                parser.exit(2, f"ローン一覧が読み込めませんでした: {e}\n")
+            if rejected:
+                print(f"読み込めない行を {rejected:,} 件除外しました。", file=sys.stderr)
+            frame = price_portfolio(loans, snapshot.events, args.at).loans
+        else:
+            frame = rate_series(snapshot, args.timeframe, args.bank, args.discount, args.start, args.end)
+    except KeyError as e:
+        parser.exit(2, f"その銀行はデータにありません: {e}\n")
+    except ValueError as e:
+        # 日時(--at / --start / --end)が読めないときなど
+        parser.exit(2, f"指定が正しくありません: {e}\n")
+
+    write(frame, args)
+
+
+def write(frame, args):
+    out = open(args.out, 'w', encoding='utf-8', newline='') if args.out else sys.stdout
+    try:
+        write_frame(frame, args.format, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
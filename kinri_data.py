@@ -0,0 +1,657 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import warnings
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime
+
+import pandas as pd
+
+from kinri_events import ChangeIndex
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow が無い環境ではディスク保存を使わず、CSV も pandas 標準のエンジンで読む
+    pa = None
+
+# チャートの期間（足）ごとのリサンプル規則
+# (規則が None の足はリサンプルせず全行をそのまま使う)
+TIMEFRAMES = {
+    "分足": None,
+    "日足": 'D',
+    "週足": 'W',
+    "年足": 'YE',
+}
+
+# 金利列の型。2.475 のような値をそのまま表示するので float64 にしています
+# (float32 だと 2.4749999 のように表示がずれます)
+RATE_DTYPE = 'float64'
+# Date 列の書式。これで読めない行が多いときだけ書式の推測に切り替える
+DATE_FORMAT = os.environ.get("KINRI_DATE_FORMAT", "%Y-%m-%d %H:%M:%S")
+# pyarrow があれば CSV のパースも pyarrow(マルチスレッド)で行う
+CSV_ENGINE = 'pyarrow' if pa is not None else 'c'
+# 取り込み中に使うメモリの上限（バイト）。保存先がデータベースのときは、フィードをこの範囲に収まる
+# 大きさずつ読んでパース・保存するので、履歴がどれだけ長くなっても取り込みのメモリは増えません
+# (SQLite やパーサーの固定分 20〜30MB ほども含めた値なので、32MB 未満にはしないでください)
+INGEST_MEMORY_BYTES = int(os.environ.get("KINRI_INGEST_MEMORY_MB", "64")) * 1024 * 1024
+# パース・正規化・保存の途中では読んだ CSV の十数倍のメモリを使うので、1回に読む大きさは上限をこれで割ったもの
+PARSE_OVERHEAD = 32
+
+
+def normalize(df, labels):
+    """型を揃えた生CSVから必要な列だけを残し、列名を日本語に変換する
+
+    labels はフィードの列名 → 画面表示用の日本語列名
+    (グラフの凡例もこれに合わせて自動で変わります)
+    """
+    columns = ['Date'] + [c for c in labels if c in df.columns]
+    return df[columns].rename(columns=labels)
+
+
+def parse_csv(raw, labels):
+    """CSV の本文(bytes)をスキーマどおりにパースして正規化する
+
+    (DataFrame, 弾いた行数) を返します。日付が読めない行、金利の欄に数値でない文字が
+    入っている行と、欄の数がヘッダーより多い行は、全体を失敗にせずその行だけ捨てます。
+    """
+    dtypes = {'Date': 'str', **{column: RATE_DTYPE for column in labels}}
+    try:
+        df, skipped = _read_csv(raw, dtypes)
+    except ValueError:
+        # 数値でないセルが混じっている → 文字列で読み直してセルごとに数値化する
+        df, skipped = _read_csv(raw, 'str')
+
+    valid = pd.Series(True, index=df.index)
+    for column in labels:
+        if column not in df or df[column].dtype == RATE_DTYPE:
+            continue
+        values = pd.to_numeric(df[column], errors='coerce').astype(RATE_DTYPE)
+        # 空欄は欠損として残し、文字が入っていて数値にできなかったセルの行だけを弾く
+        valid &= values.notna() | df[column].isna()
+        df[column] = values
+
+    df['Date'] = _parse_dates(df['Date'])
+    valid &= df['Date'].notna()
+
+    rejected = int((~valid).sum())
+    if rejected:
+        df = df[valid].reset_index(drop=True)
+    return normalize(df, labels), rejected + skipped
+
+
+def _read_csv(raw, dtype):
+    """欄の数が合わない行を飛ばして読み、(DataFrame, 飛ばした行数) を返す"""
+    if CSV_ENGINE == 'pyarrow':
+        bad_rows = []
+
+        def skip(row):
+            bad_rows.append(row)
+            return 'skip'
+
+        df = pd.read_csv(io.BytesIO(raw), dtype=dtype, engine='pyarrow', on_bad_lines=skip)
+        return df, len(bad_rows)
+    # 標準のエンジンは飛ばした行を警告で知らせるだけなので、警告の中の行数を数える
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', pd.errors.ParserWarning)
+        df = pd.read_csv(io.BytesIO(raw), dtype=dtype, engine='c', on_bad_lines='warn')
+    skipped = sum(str(w.message).count('Skipping line') for w in caught if issubclass(w.category, pd.errors.ParserWarning))
+    return df, skipped
+
+
+def _parse_dates(text):
+    dates = pd.to_datetime(text, format=DATE_FORMAT, errors='coerce')
+    # 書式が合わない(シート側の表示形式が違う)ときは推測で読み直す
+    if dates.isna().sum() > text.notna().sum() // 2:
+        dates = pd.to_datetime(text, format='mixed', errors='coerce')
+    return dates
+
+
+def compact_samples(df):
+    """サンプルの表を、どれかの金利が変わった日時と最後の日時の行だけに詰める
+
+    変更の索引(ChangeIndex)は詰める前と同じものが作れるので、全サンプルを保存先に任せたあとは
+    これだけをメモリに持てば足ります。
+    """
+    if df.empty:
+        return df
+    if not df['Date'].is_monotonic_increasing:
+        df = df.sort_values('Date', ignore_index=True)
+    return ChangeIndex.from_frame(df).step_frame()
+
+
+def build_timeframe(df_sorted, name, indexed=None):
+    """期間（足） name の集計を作る。indexed は Date を索引にした df_sorted(使い回し用)
+
+    金利が変わった行だけの表を渡すと、変更の無かった期間は行ごと詰めます
+    (その期間は直前の金利が続いているだけなので、step-after の線は変わりません)。
+    """
+    rule = TIMEFRAMES[name]
+    if rule is None:
+        return df_sorted
+    if indexed is None:
+        indexed = df_sorted.set_index('Date')
+    resampled = indexed.resample(rule).last().dropna(how='all')
+    return resampled.reset_index()
+
+
+def freeze_frame(df):
+    """中身をコピーせず、列の配列を書き込み禁止にした DataFrame を返す
+
+    スナップショットは全セッションで同じオブジェクトを共有するので、
+    どこかで誤って上書きしようとしたらその場でエラーになるようにしておきます。
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column].to_numpy()
+        values.flags.writeable = False
+        columns[column] = values
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+def build_timeframes(df_sorted):
+    """全ての期間（足）の集計をまとめて作る。データの版ごとに1回だけ呼ばれる"""
+    indexed = df_sorted.set_index('Date')
+    return {name: build_timeframe(df_sorted, name, indexed) for name in TIMEFRAMES}
+
+
+class RateStore:
+    """正規化済みの金利履歴を Arrow IPC 形式(列指向)でディスクに保存する
+
+    読み込みはメモリマップで行うので、起動直後でもファイルサイズに関係なくすぐに使えます。
+    フェッチャーの差分取得の状態(ETagなど)もスキーマのメタデータに一緒に保存し、
+    再起動後も差分取得を続けられるようにしています。
+    """
+
+    META_KEY = b'kinri_fetch_state'
+
+    def __init__(self, path):
+        self.path = path
+
+    @property
+    def available(self):
+        return pa is not None
+
+    def load(self):
+        """(DataFrame, フェッチャーの状態) を返す。保存データが無ければ (None, None)"""
+        if not self.available or not os.path.exists(self.path):
+            return None, None
+        try:
+            table = pa.ipc.open_file(pa.memory_map(self.path)).read_all()
+        except (OSError, pa.ArrowInvalid):
+            return None, None
+        meta = table.schema.metadata or {}
+        state = json.loads(meta[self.META_KEY]) if self.META_KEY in meta else None
+        # split_blocks=True で列ごとにメモリマップ上のバッファをそのまま使う
+        return table.to_pandas(split_blocks=True), state
+
+    def save(self, df, state, start=0):
+        # Arrow のファイルは追記できないので、start に関係なく毎回全体を書き直す
+        if not self.available:
+            return
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        meta = dict(table.schema.metadata or {})
+        meta[self.META_KEY] = json.dumps(state).encode()
+        table = table.replace_schema_metadata(meta)
+
+        # 一時ファイルに書いてから置き換え、読み込み途中のプロセスが壊れたファイルを見ないようにする
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, self.path)
+
+
+class IncrementalCsvFetcher:
+    """公開CSVを差分で取り込むフェッチャー
+
+    - ETag / Last-Modified を使った条件付きリクエストを送り、304 なら前回の結果をそのまま返す
+    - 200 が返ってきても本文の先頭が前回パースした範囲と一致していれば、
+      末尾に追記された行だけをパースして既存の DataFrame に連結する
+    - 途中の行が書き換えられていた場合(先頭が一致しない場合)は全件パースし直す
+    - 最後の行が改行で終わっていない(Google スプレッドシートの公開CSVはそうなっています)ときは、
+      その行はまだ書き換わるかもしれないので「パース済みの範囲」には含めず、次の取得で読み直して置き換える
+    - labels(フィードの列名 → 日本語列名)に載っている列だけを取り込む
+    - store (RateStore か RateDatabase.source_store) を渡すと、更新があるたびにディスクへ保存する
+    - chunk_bytes を渡すと、本文を一度に読まずに chunk_bytes ずつ読んでパースし、そのたびに store へ
+      書き足す(store は RateDatabase.source_store)。このとき df には全サンプルではなく
+      compact_samples で詰めた行だけを持つので、取り込み中のメモリは履歴の長さによらず一定です
+    """
+
+    def __init__(self, url, labels, timeout=30, store=None, chunk_bytes=None):
+        self.url = url
+        self.labels = labels
+        self.timeout = timeout
+        self.store = store
+        self.chunk_bytes = chunk_bytes
+        self.df = None
+        self.etag = None
+        self.last_modified = None
+        self.sampled_rows = 0     # 取り込んだサンプルの行数
+        self.rejected_rows = 0    # スキーマに合わず弾いた行数
+        self._header = b''        # CSVのヘッダー行(改行込み)
+        self._parsed_bytes = 0    # パース済みの本文バイト数(改行で終わっている最後の行の終わりまで)
+        self._parsed_digest = None  # パース済み範囲のハッシュ
+        self._body_digest = None  # 本文全体のハッシュ(データの版)
+        self._partial_rows = 0    # 改行で終わっていない最後の行から取り込んだ行数(次の取得で置き換える)
+        self._partial_rejected = 0  # 同じく、その行を弾いた数
+        self._partial_date = None  # 少しずつ読む取り込みで、その行の日時(保存先と詰めた表から外すときに使う)
+        self._complete_end = None  # 同じく、改行で終わっている最後の行の日時
+        self._lock = threading.Lock()
+
+    def load_store(self):
+        """ディスクの保存データから前回の状態を復元する。復元できたら True"""
+        if self.store is None:
+            return False
+        if self.chunk_bytes:
+            df, state = self.store.load(changes_only=True)
+        else:
+            df, state = self.store.load()
+        if df is None or state is None or df.empty:
+            # 行の無い保存データ(ヘッダーだけのフィードなど)は、復元せずに次の取得で全件読み直す
+            return False
+        with self._lock:
+            self.df = compact_samples(df) if self.chunk_bytes else df
+            self.sampled_rows = state.get('sampled_rows', len(df))
+            self.etag = state['etag']
+            self.last_modified = state['last_modified']
+            self._header = state['header'].encode()
+            self._parsed_bytes = state['parsed_bytes']
+            self._parsed_digest = bytes.fromhex(state['parsed_digest'])
+            self._body_digest = bytes.fromhex(state.get('body_digest', state['parsed_digest']))
+            self._partial_rows = state.get('partial_rows', 0)
+            self._partial_rejected = state.get('partial_rejected', 0)
+            self._partial_date = _timestamp_or_none(state.get('partial_date'))
+            self._complete_end = _timestamp_or_none(state.get('complete_end'))
+            self.rejected_rows = state.get('rejected_rows', 0)
+        return True
+
+    def fetch(self):
+        """最新のデータを取り込み、(DataFrame, 更新があったか) を返す"""
+        with self._lock:
+            return self._fetch()
+
+    @property
+    def version(self):
+        """取り込み済みデータの版。取り込んだ本文のハッシュなので再起動しても変わらない"""
+        return self._body_digest.hex()[:16] if self._body_digest else None
+
+    def _fetch(self):
+        if self.chunk_bytes:
+            return self._fetch_chunked()
+        body, etag, last_modified = self._download()
+        if body is None:
+            return self.df, False
+
+        body_digest = hashlib.sha1(body).digest()
+        if self.df is not None and self._is_append_only(body):
+            if body_digest == self._body_digest or not body[self._parsed_bytes:].strip():
+                self.etag, self.last_modified = etag, last_modified
+                return self.df, False
+            # 前回の最後の行が改行で終わっていなかったときは、その行から取り込んだ分を外して読み直す
+            kept = len(self.df) - self._partial_rows
+            df = self.df.iloc[:kept]
+            rejected = self.rejected_rows - self._partial_rejected
+            header, start = self._header, self._parsed_bytes
+        else:
+            kept, df, rejected = 0, None, 0
+            start = body.find(b'\n') + 1 or len(body)
+            header = body[:start] if body[:start].endswith(b'\n') else body[:start] + b'\n'
+        # 改行で終わっている行(complete)と、最後の改行の後ろの書きかけかもしれない行(partial)を別々にパースする
+        end = max(body.rfind(b'\n') + 1, start)
+        complete, bad = parse_csv(header + body[start:end], self.labels)
+        partial, partial_bad = parse_csv(header + body[end:], self.labels)
+        pieces = [f for f in (df, complete, partial) if f is not None and not f.empty]
+        df = pd.concat(pieces, ignore_index=True) if pieces else complete
+
+        # パースに成功してから状態を更新する
+        self.df = df
+        self.sampled_rows = len(df)
+        self.rejected_rows = rejected + bad + partial_bad
+        self._header = header
+        self.etag, self.last_modified = etag, last_modified
+        self._parsed_bytes = end
+        self._parsed_digest = hashlib.sha1(body[:end]).digest()
+        self._body_digest = body_digest
+        self._partial_rows, self._partial_rejected = len(partial), partial_bad
+        saved_rows = kept  # 保存先に書き済みの行数(追記のときはその後ろだけを保存する)
+        if self.store is not None:
+            self.store.save(self.df, self._state(), start=saved_rows)
+        return self.df, True
+
+    def _fetch_chunked(self):
+        res = self._open(conditional=self.df is not None)
+        if res is None:
+            return self.df, False
+        with res:
+            try:
+                return self._ingest(res, append=self.df is not None)
+            except _Rewritten:
+                pass
+        # 途中の行が書き換えられていた → 最初から読み直して全件入れ替える
+        with self._open(conditional=False) as res:
+            return self._ingest(res, append=False)
+
+    def _ingest(self, res, append):
+        """本文を chunk_bytes ずつ読み、行の区切りで切ってパースしては store に書き足す
+
+        append=True なら前回パースした範囲は読み飛ばし(ハッシュだけ確かめ)、その後ろだけを取り込みます。
+        最後の改行の後ろの書きかけかもしれない行は、パースして保存はしますが「パース済みの範囲」には含めず、
+        次の取得で前回その行から取り込んだ分を外してから読み直します。
+        全部読み終えて保存が確定してから、df などの状態を差し替えます。
+        """
+        skip = self._parsed_bytes if append else 0
+        header = self._header if append else b''
+        df = self._without_partial(self.df) if append else None
+        sampled = self.sampled_rows - self._partial_rows if append else 0
+        rejected = self.rejected_rows - self._partial_rejected if append else 0
+        stale = self._partial_date if append else None  # 保存先から消す、前回の書きかけの行の日時
+        digest = hashlib.sha1()       # パース済みの範囲(改行で終わっている最後の行まで)のハッシュ
+        body_digest = hashlib.sha1()  # 本文全体のハッシュ
+        read = 0
+        carry = b''  # 行の途中で切れた残り
+        changed = False
+
+        writer = self.store.writer(replace=not append) if self.store is not None else nullcontext()
+        with writer as writer:
+            def save(rows):
+                nonlocal stale
+                if writer is None:
+                    return
+                if stale is not None:
+                    writer.discard(stale)
+                    stale = None
+                writer.append(rows)
+
+            while True:
+                block = res.read(self.chunk_bytes)
+                if read < skip:
+                    # 前回パースした範囲。中身は捨て、範囲の終わりでハッシュが一致するかだけを見る
+                    if not block:
+                        raise _Rewritten()  # 前回より短くなっている
+                    head = block[:skip - read]
+                    digest.update(head)
+                    body_digest.update(head)
+                    read += len(head)
+                    block = block[len(head):]
+                    if read == skip and digest.digest() != self._parsed_digest:
+                        raise _Rewritten()
+                    if not block:
+                        continue
+                if not block:
+                    break
+                body_digest.update(block)
+
+                data = carry + block
+                cut = data.rfind(b'\n') + 1
+                lines, carry = data[:cut], data[cut:]
+                digest.update(lines)
+                read += len(lines)
+                if len(carry) > self.chunk_bytes:
+                    raise ValueError(f"CSV の1行が長すぎます ({len(carry):,} バイト以上)")
+                if not header:
+                    header, lines = lines[:lines.find(b'\n') + 1], lines[lines.find(b'\n') + 1:]
+                if not lines.strip():
+                    continue
+
+                rows, bad = parse_csv(header + lines, self.labels)
+                rejected += bad
+                changed = True
+                if rows.empty:
+                    continue
+                save(rows)
+                sampled += len(rows)
+                df = compact_samples(rows if df is None else pd.concat([df, rows], ignore_index=True))
+
+            if not header and carry:
+                # 改行の無いヘッダーだけの本文
+                header, carry = carry + b'\n', b''
+                digest.update(header[:-1])
+                read += len(header) - 1
+
+            # 前回から何も増えていなければ、保存先はそのまま
+            etag, last_modified = res.headers.get('ETag'), res.headers.get('Last-Modified')
+            if append and (body_digest.digest() == self._body_digest or not (changed or carry.strip())):
+                self.etag, self.last_modified = etag, last_modified
+                return self.df, False
+
+            complete_end = df['Date'].iloc[-1] if df is not None and not df.empty else None
+            partial, partial_bad = parse_csv(header + carry, self.labels) if carry.strip() else (None, 0)
+            partial_date = None
+            rejected += partial_bad
+            if partial is not None and not partial.empty:
+                save(partial)
+                sampled += len(partial)
+                partial_date = partial['Date'].iloc[-1]
+                df = compact_samples(partial if df is None else pd.concat([df, partial], ignore_index=True))
+            if stale is not None and writer is not None:
+                writer.discard(stale)
+            if df is None:
+                df = normalize(pd.DataFrame({'Date': pd.Series(dtype='datetime64[ns]')}), self.labels)
+            partial_rows = len(partial) if partial is not None else 0
+            state = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'header': header.decode(),
+                'parsed_bytes': read,
+                'parsed_digest': digest.hexdigest(),
+                'body_digest': body_digest.hexdigest(),
+                'partial_rows': partial_rows,
+                'partial_rejected': partial_bad,
+                'partial_date': _isoformat_or_none(partial_date),
+                'complete_end': _isoformat_or_none(complete_end),
+                'rejected_rows': rejected,
+                'sampled_rows': sampled,
+            }
+            if writer is not None:
+                writer.finish(state)
+
+        self.df = df
+        self.etag, self.last_modified = etag, last_modified
+        self._header = header
+        self._parsed_bytes = read
+        self._parsed_digest = digest.digest()
+        self._body_digest = body_digest.digest()
+        self._partial_rows, self._partial_rejected = partial_rows, partial_bad
+        self._partial_date, self._complete_end = partial_date, complete_end
+        self.sampled_rows, self.rejected_rows = sampled, rejected
+        return self.df, True
+
+    def _without_partial(self, df):
+        """詰めた表から、前回の書きかけの行から取り込んだ日時の行を外す
+
+        外した行が最後の日時の行を兼ねていたときは、改行で終わっている最後の行の日時に
+        直前の金利の行を置き直すので、その行を取り込む前に詰めた表と同じになります。
+        """
+        if df is None or self._partial_date is None:
+            return df
+        df = df[df['Date'] != self._partial_date]
+        if self._complete_end is not None and not df.empty and df['Date'].iloc[-1] < self._complete_end:
+            df = pd.concat([df, df.iloc[[-1]].assign(Date=self._complete_end)], ignore_index=True)
+        return df.reset_index(drop=True)
+
+    def _state(self):
+        return {
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'header': self._header.decode(),
+            'parsed_bytes': self._parsed_bytes,
+            'parsed_digest': self._parsed_digest.hex(),
+            'body_digest': self._body_digest.hex(),
+            'partial_rows': self._partial_rows,
+            'partial_rejected': self._partial_rejected,
+            'rejected_rows': self.rejected_rows,
+            'sampled_rows': self.sampled_rows,
+        }
+
+    def _open(self, conditional):
+        # 条件付きリクエスト。変更が無ければ None(本文は呼び出し側が読んで閉じる)
+        request = urllib.request.Request(self.url)
+        if conditional:
+            if self.etag:
+                request.add_header('If-None-Match', self.etag)
+            if self.last_modified:
+                request.add_header('If-Modified-Since', self.last_modified)
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None
+            raise
+
+    def _download(self):
+        res = self._open(conditional=self.df is not None)
+        if res is None:
+            return None, None, None
+        with res:
+            return res.read(), res.headers.get('ETag'), res.headers.get('Last-Modified')
+
+    def _is_append_only(self, body):
+        # 前回パースした範囲がそのまま残っていれば追記のみとみなす
+        if len(body) < self._parsed_bytes:
+            return False
+        digest = hashlib.sha1(body[:self._parsed_bytes]).digest()
+        return digest == self._parsed_digest
+
+
+class _Rewritten(Exception):
+    """前回パースした範囲が書き換えられていた(追記だけではなかった)"""
+
+
+def _isoformat_or_none(when):
+    return None if when is None else pd.Timestamp(when).isoformat()
+
+
+def _timestamp_or_none(text):
+    return None if text is None else pd.Timestamp(text)
+
+
+@dataclass(frozen=True)
+class RateSnapshot:
+    """ある時点で取り込みが完了した金利履歴。一度作ったら中身は変えない
+
+    events は銀行ごとの金利変更の索引で、df はそこから作った「どれかの金利が変わった日時
+    (と最後の日時)だけ」の日付順の表、frames は df から作った期間（足）ごとの集計です。
+    表示はすべてこの3つから作るので、大きさはサンプルの行数ではなく変更の回数で決まります。
+    プロセスに1つだけ作り、全セッションがコピーせずに同じものを参照します
+    (どの配列も書き込み禁止にしてあります)。
+    """
+    df: pd.DataFrame
+    frames: dict
+    events: ChangeIndex
+    version: str
+    fetched_at: datetime
+    sampled_rows: int = 0  # 取り込んだサンプルの行数
+    rejected_rows: int = 0
+    build_ms: float = 0.0  # 並べ替え・変更の抽出・足ごとの集計に掛かった時間
+
+    @property
+    def nbytes(self):
+        """スナップショット全体(変更の索引・表・足ごとの集計)のメモリ使用量"""
+        frames = {id(self.df): self.df, **{id(f): f for f in self.frames.values()}}
+        return self.events.nbytes + int(sum(f.memory_usage(index=True).sum() for f in frames.values()))
+
+
+class RateRefresher:
+    """バックグラウンドで定期的にフィードを取り込み、最新のスナップショットを差し替えるスレッド
+
+    画面の描画は常に「最後に取り込みが完了したスナップショット」を読むだけなので、
+    ネットワーク取得を待たされることはありません(stale-while-revalidate)。
+    スナップショットの差し替えは属性の代入1回なので、読む側がロックを取る必要もありません。
+    """
+
+    def __init__(self, fetcher, interval=600):
+        self.fetcher = fetcher
+        self.interval = interval
+        self.snapshot = None
+        self.last_error = None
+        self.last_checked_at = None
+        self._wake = threading.Event()
+        self._done = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        # 保存データがあれば、最初の取得を待たずにそれを表示できるようにする
+        # (保存データが読めなくても、裏の取り込みは始めて次の取得で立て直す)
+        try:
+            if self.fetcher.load_store():
+                self._publish()
+        except Exception as e:
+            self.last_error = e
+        self._thread = threading.Thread(target=self._run, name="kinri-refresher", daemon=True)
+        self._thread.start()
+        return self
+
+    def request_refresh(self):
+        """次の定期更新を待たずに、すぐ取り込みを始めてもらう(完了は待たない)"""
+        self._wake.set()
+
+    def wait_snapshot(self, timeout=None):
+        """スナップショットが1つもまだ無いときだけ、最初の取り込み完了を待つ"""
+        with self._done:
+            self._done.wait_for(
+                lambda: self.snapshot is not None or self.last_checked_at is not None,
+                timeout=timeout,
+            )
+        return self.snapshot
+
+    def _run(self):
+        while True:
+            self._refresh_once()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _refresh_once(self):
+        try:
+            _, changed = self.fetcher.fetch()
+            if changed or self.snapshot is None:
+                self._publish()
+            self.last_error = None
+        except Exception as e:
+            # 取得に失敗しても、前回のスナップショットをそのまま使い続ける
+            self.last_error = e
+        with self._done:
+            self.last_checked_at = datetime.now()
+            self._done.notify_all()
+
+    def _publish(self):
+        if self.fetcher.df is None:
+            return
+        self.snapshot = build_snapshot(
+            self.fetcher.df, self.fetcher.version, self.fetcher.rejected_rows, self.fetcher.sampled_rows
+        )
+
+
+def build_snapshot(df, version, rejected_rows=0, sampled_rows=None):
+    """取り込んだ表から RateSnapshot を作る(並べ替え・変更の抽出・足ごとのリサンプルはここで1回だけ)
+
+    行が1つも無い(ヘッダーだけのフィードや、全行を弾いたとき)は None を返します。
+    """
+    if df is None or df.empty:
+        return None
+    t0 = time.perf_counter()
+    if not df['Date'].is_monotonic_increasing:
+        df = df.sort_values('Date', ignore_index=True)
+    # スナップショットには変更の索引から作った表だけを持たせ、全サンプルの表は参照しない
+    events = ChangeIndex.from_frame(df)
+    df_steps = freeze_frame(events.step_frame())
+    frames = {
+        name: f if f is df_steps else freeze_frame(f)
+        for name, f in build_timeframes(df_steps).items()
+    }
+    return RateSnapshot(
+        df=df_steps,
+        frames=frames,
+        events=events,
+        version=version,
+        fetched_at=datetime.now(),
+        sampled_rows=len(df) if sampled_rows is None else sampled_rows,
+        rejected_rows=rejected_rows,
+        build_ms=round((time.perf_counter() - t0) * 1000, 3),
+    )
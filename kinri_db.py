@@ -0,0 +1,258 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+
+import numpy as np
+import pandas as pd
+
+# 期間（足）ごとの区切り。日時(ナノ秒)から区切りの最後の日(1970-01-01 からの日数)を出す SQL
+# (pandas の resample と同じく、週足は日曜まで・年足は12月31日までを1つにまとめます)
+DAY_NS = 86_400 * 10**9
+BUCKET_SQL = {
+    'D': f"date / {DAY_NS}",
+    # 1970-01-01 は木曜日なので、(日数 + 3) % 7 が月曜 0 〜 日曜 6 になる
+    'W': f"date / {DAY_NS} + 6 - (date / {DAY_NS} + 3) % 7",
+    'YE': f"CAST(julianday(strftime('%Y-12-31', date / 1000000000, 'unixepoch')) - 2440587.5 AS INTEGER)",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rates (
+    source TEXT NOT NULL,
+    bank TEXT NOT NULL,
+    date INTEGER NOT NULL,  -- 日時 (1970-01-01 からのナノ秒)
+    rate REAL NOT NULL,
+    PRIMARY KEY (bank, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rates_date ON rates (date, bank);
+CREATE TABLE IF NOT EXISTS fetch_state (
+    source TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+);
+"""
+
+
+def to_ns(dates):
+    """日時(1つでも配列でも可)を、保存に使う 1970-01-01 からのナノ秒にする"""
+    return pd.to_datetime(np.atleast_1d(dates)).to_numpy('datetime64[ns]').view('int64')
+
+
+class RateDatabase:
+    """金利履歴の置き場(SQLite)。全ソースの履歴を (銀行, 日時, 金利) の縦持ちで1つのファイルに持つ
+
+    (銀行, 日時) が主キーで、日時にも索引があるので、期間の絞り込み・最新の値・足ごとの集計は
+    履歴をメモリに読み込まずに SQL で行えます。フェッチャーからは source_store(ソース名) を
+    RateStore と同じように使い、取り込みのたびに追記された行だけを書き足します。
+    接続は呼び出しごとに開くので、取り込みのスレッドと画面のスレッドから同時に使えます。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._init_lock = threading.Lock()
+        self._ready = False
+
+    def source_store(self, source):
+        return SourceStore(self, source)
+
+    def _connect(self):
+        if not self._ready:
+            with self._init_lock:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with closing(sqlite3.connect(self.path)) as conn:
+                    # 書き込み中でも読み出しを待たせない
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(SCHEMA)
+                self._ready = True
+        return closing(sqlite3.connect(self.path, timeout=30))
+
+    # --- フェッチャーからの保存と復元 ---
+
+    def load(self, source, changes_only=False):
+        """source の (横持ちの DataFrame, フェッチャーの状態) を返す。保存データが無ければ (None, None)
+
+        changes_only=True なら、各銀行の金利が変わった行と最後の日時の行だけを読みます
+        (変わらなかった欄は NaN)。履歴の長さではなく変更の回数に比例したメモリで復元できます。
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT state FROM fetch_state WHERE source = ?", (source,)).fetchone()
+            if row is None:
+                return None, None
+            if changes_only:
+                query = """SELECT date, bank, rate FROM (
+                        SELECT date, bank, rate, LAG(rate) OVER (PARTITION BY bank ORDER BY date) AS prev
+                        FROM rates WHERE source = ?)
+                    WHERE prev IS NULL OR prev != rate
+                        OR date = (SELECT MAX(date) FROM rates WHERE source = ?)
+                    ORDER BY date"""
+                long = pd.read_sql_query(query, conn, params=(source, source))
+            else:
+                long = pd.read_sql_query(
+                    "SELECT date, bank, rate FROM rates WHERE source = ? ORDER BY date", conn, params=(source,)
+                )
+        state = json.loads(row[0])
+        return self._to_wide(long, state.get('labels')), state
+
+    def save(self, source, df, state, start=0):
+        """df の start 行目から後を書き足す(start=0 なら source の履歴を全部入れ替える)"""
+        with self.writer(source, replace=start == 0) as writer:
+            writer.append(df.iloc[start:])
+            writer.finish(state)
+
+    @contextmanager
+    def writer(self, source, replace=False):
+        """1回の取り込みぶんを少しずつ書き込む。with を抜けたときにまとめて確定する
+
+        途中で例外が起きたら何も書かなかったことになるので、読む側が書きかけの履歴を見ることはありません。
+        replace=True なら source の履歴を全部入れ替えます。
+        """
+        with self._connect() as conn, conn:
+            if replace:
+                conn.execute("DELETE FROM rates WHERE source = ?", (source,))
+            yield SourceWriter(conn, source)
+
+    # --- 履歴を読み込まずに答える問い合わせ ---
+
+    def labels(self):
+        """保存されている系列名(ソースの登録順・ソース内の列順)"""
+        with self._connect() as conn:
+            return [
+                label for (state,) in conn.execute("SELECT state FROM fetch_state ORDER BY rowid")
+                for label in json.loads(state).get('labels', [])
+            ]
+
+    def latest(self, labels=None):
+        """銀行ごとの最新の金利を1行の表 (Date, 銀行...) で返す。Date は一番新しい日時"""
+        labels = self.labels() if labels is None else labels
+        with self._connect() as conn:
+            # (bank, date) の主キーを後ろから引くので、銀行1つにつき O(log n) で済む
+            rows = {
+                label: conn.execute(
+                    "SELECT date, rate FROM rates WHERE bank = ? ORDER BY date DESC LIMIT 1", (label,)
+                ).fetchone()
+                for label in labels
+            }
+        rows = {label: row for label, row in rows.items() if row is not None}
+        if not rows:
+            return None
+        latest = {'Date': pd.to_datetime(max(date for date, _ in rows.values()))}
+        latest.update({label: rate for label, (_, rate) in rows.items()})
+        return pd.DataFrame([latest])
+
+    def count(self, start=None, end=None):
+        """期間内の日時(行)の数"""
+        where, params = self._range(start, end)
+        with self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(DISTINCT date) FROM rates {where}", params).fetchone()[0]
+
+    def samples(self, start=None, end=None, labels=None, limit=None, offset=0, newest_first=False):
+        """期間内のサンプルを横持ちの表で返す。limit / offset でページ単位に切り出せる"""
+        labels = self.labels() if labels is None else labels
+        where, params = self._range(start, end)
+        order = "DESC" if newest_first else "ASC"
+        page = f"LIMIT {int(limit)} OFFSET {int(offset)}" if limit is not None else ""
+        with self._connect() as conn:
+            # 先に日時だけをページ単位に切り出し、その日時の行だけを読む
+            long = pd.read_sql_query(
+                f"""SELECT date, bank, rate FROM rates
+                    WHERE date IN (SELECT DISTINCT date FROM rates {where} ORDER BY date {order} {page})
+                    ORDER BY date {order}""",
+                conn, params=params,
+            )
+        return self._to_wide(long, labels, ascending=not newest_first)
+
+    def resample(self, rule, start=None, end=None, labels=None):
+        """期間（足）ごとに、各銀行の区切りの中で最後の金利を返す(サンプルの無い区切りは行なし)
+
+        rule は 'D'(日足)・'W'(週足)・'YE'(年足)。行の Date は区切りの最後の日です。
+        """
+        labels = self.labels() if labels is None else labels
+        where, params = self._range(start, end)
+        bucket = BUCKET_SQL[rule]
+        with self._connect() as conn:
+            # MAX(date) と一緒に選んだ rate は、SQLite ではその最後の行の値になる
+            long = pd.read_sql_query(
+                f"""SELECT bank, {bucket} AS day, MAX(date) AS last, rate FROM rates {where}
+                    GROUP BY bank, day ORDER BY day""",
+                conn, params=params,
+            )
+        long['date'] = long['day'] * DAY_NS
+        return self._to_wide(long, labels)
+
+    @staticmethod
+    def _range(start, end):
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("date >= ?")
+            params.append(int(to_ns(start)[0]))
+        if end is not None:
+            clauses.append("date <= ?")
+            params.append(int(to_ns(end)[0]))
+        return ("WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    @staticmethod
+    def _to_wide(long, labels=None, ascending=True):
+        wide = long.pivot(index='date', columns='bank', values='rate')
+        if labels is not None:
+            wide = wide.reindex(columns=list(labels))
+        wide = wide.sort_index(ascending=ascending)
+        wide.index = pd.to_datetime(wide.index.to_numpy(dtype='int64'))
+        wide.columns.name = None
+        return wide.rename_axis('Date').reset_index()
+
+
+class SourceWriter:
+    """RateDatabase.writer が返す、1回の取り込みの書き込み先"""
+
+    def __init__(self, conn, source):
+        self.conn = conn
+        self.source = source
+        self.labels = None
+
+    def append(self, rows):
+        """正規化済みの行 (Date, 銀行...) を書き足す"""
+        labels = [c for c in rows.columns if c != 'Date']
+        self.labels = self.labels or labels
+        dates = to_ns(rows['Date']).tolist()
+        # 行のリストは作らずに1行ずつ渡し、書き込み中のメモリを chunk の大きさ程度に抑える
+        records = (
+            (self.source, label, date, rate)
+            for label in labels
+            for date, rate in zip(dates, rows[label].to_numpy(dtype='float64').tolist())
+            if rate == rate  # 空欄(NaN)は保存しない
+        )
+        # 同じ日時の行が2度届いたときは後から届いた値を使う
+        self.conn.executemany("INSERT OR REPLACE INTO rates VALUES (?, ?, ?, ?)", records)
+
+    def discard(self, date):
+        """date の日時の行を消す(前回の書きかけの行から保存した分を読み直す前に使う)"""
+        self.conn.execute("DELETE FROM rates WHERE source = ? AND date = ?", (self.source, int(to_ns(date)[0])))
+
+    def finish(self, state):
+        """フェッチャーの状態を書く(履歴と同じトランザクションで確定する)"""
+        labels = self.labels
+        if labels is None:
+            row = self.conn.execute("SELECT state FROM fetch_state WHERE source = ?", (self.source,)).fetchone()
+            labels = json.loads(row[0]).get('labels', []) if row else []
+        # 登録順(rowid)を変えないように、既にあるソースは状態だけを書き換える
+        self.conn.execute(
+            "INSERT INTO fetch_state VALUES (?, ?) ON CONFLICT (source) DO UPDATE SET state = excluded.state",
+            (self.source, json.dumps({**state, 'labels': labels})),
+        )
+
+
+class SourceStore:
+    """RateDatabase の中の1ソースぶんを、RateStore と同じ形(load / save)で使うためのもの"""
+
+    def __init__(self, database, source):
+        self.database = database
+        self.source = source
+
+    def load(self, changes_only=False):
+        return self.database.load(self.source, changes_only)
+
+    def save(self, df, state, start=0):
+        self.database.save(self.source, df, state, start)
+
+    def writer(self, replace=False):
+        return self.database.writer(self.source, replace)
@@ -0,0 +1,137 @@
+"""My金利ウォッチの計算エンジン（Streamlit・Altair を使わずに読み込み・計算だけを行う）
+
+画面(kinri.py)・コマンドライン(kinri_cli.py)・HTTP API(kinri_api.py)から使います。
+"""
+import os
+
+import pandas as pd
+
+from kinri_calc import effective_rate, my_rate_series
+from kinri_data import TIMEFRAMES, build_snapshot
+from kinri_db import RateDatabase
+from kinri_sources import SHEET_SERIES, CsvSource
+
+# ==========================================
+# 👇 スプレッドシートのURL（そのままでOK）
+# (ローカルで試すときは環境変数 KINRI_CSV_URL で差し替えできます)
+CSV_URL = os.environ.get(
+    "KINRI_CSV_URL",
+    "https://docs.google.com/spreadsheets/d/e/2PACX-1vS8hJRst-sZ2V_rzHW77OK5NBbDGRwJ8O7bYNoofq2l7gtqE8ZzPSUq39xPI4IDp4-q1NXdapzo-hZE/pub?output=csv"
+)
+# 「借りている銀行」の初期値
+DEFAULT_BANK = "横浜"
+# 優遇幅の初期値
+DEFAULT_DISCOUNT = 1.85
+# 取り込んだ履歴の保存先フォルダ（再起動してもここからすぐに表示できます）
+STORE_DIR = os.environ.get("KINRI_STORE_DIR", "data")
+# 保存形式。"sqlite" なら全ソースの履歴を <STORE_DIR>/kinri.sqlite にまとめ、期間の絞り込みなどを SQL で行います
+# ("arrow" ならソースごとの Arrow ファイルに保存します)
+STORE_FORMAT = os.environ.get("KINRI_STORE_FORMAT", "sqlite")
+# フィードの日時(タイムゾーンなし)がどこの時刻か。"2024-01-01T00:00:00Z" のようにタイムゾーン付きで
+# 日時を指定されたときは、この時刻に直してから比べます
+DATA_TZ = os.environ.get("KINRI_DATA_TZ", "Asia/Tokyo")
+# ポートフォリオ（お客様のローン一覧 CSV）の置き場所。画面でファイルを選ばなかったときに使います
+PORTFOLIO_PATH = os.environ.get("KINRI_PORTFOLIO_PATH")
+# ==========================================
+
+
+# 👇 金利のソース。銀行を増やすときはここにソースか系列を足すだけで、
+#    銀行の選択肢やグラフの凡例にも自動で反映されます
+#    (列名と日本語名の対応は kinri_sources.SHEET_SERIES にあります)
+def make_sources(csv_url=CSV_URL, store_dir=STORE_DIR):
+    database = open_database(store_dir)
+    return [CsvSource("sheet", csv_url, SHEET_SERIES, store_dir=store_dir, database=database)]
+
+
+def open_database(store_dir=STORE_DIR):
+    """履歴のデータベース。SQLite に保存しない設定なら None"""
+    if not store_dir or STORE_FORMAT != "sqlite":
+        return None
+    return RateDatabase(os.path.join(store_dir, "kinri.sqlite"))
+
+
+def load_snapshot(fetcher, offline=False):
+    """保存データを復元し(offline=False なら最新も取り込んで)、スナップショットを1つ作る
+
+    裏で定期的に取り込むスレッドは使わない、1回限りの読み込みです。データが無ければ None。
+    取り込みに失敗しても、保存データがあればそれで続けます(無ければ例外をそのまま投げます)。
+    """
+    restored = fetcher.load_store()
+    if not offline:
+        try:
+            fetcher.fetch()
+        except Exception:
+            if not restored:
+                raise
+    if fetcher.df is None or fetcher.df.empty:
+        return None
+    return build_snapshot(fetcher.df, fetcher.version, fetcher.rejected_rows, fetcher.sampled_rows)
+
+
+def latest_rates(snapshot):
+    """今の全系列の金利 (Date と系列ごとの金利の1行の表)"""
+    return snapshot.df.iloc[[-1]].reset_index(drop=True)
+
+
+def my_rate(snapshot, bank, discount, at=None):
+    """at の時点(省略時は最新)の bank の店頭金利と My金利"""
+    when = snapshot.events.end if at is None else _timestamp(at)
+    store_rate = snapshot.events.rate_at(bank, when)
+    return pd.DataFrame([{
+        'Date': pd.Timestamp(when),
+        'Bank': bank,
+        'StoreRate': store_rate,
+        'Discount': discount,
+        'MyRate': float(effective_rate(store_rate, discount)),
+    }])
+
+
+def rate_series(snapshot, timeframe, bank=None, discount=None, start=None, end=None):
+    """期間（足）ごとの金利の推移。bank と discount を渡すと My金利 の列も付ける
+
+    行は金利が変わった時点(と最後の時点)だけです。start / end で日付を絞り込めます。
+    start で絞り込んだときは、start の時点で既に適用されていた金利を先頭の行(Date は start)に入れます。
+    """
+    if timeframe not in TIMEFRAMES:
+        raise ValueError(f"期間（足）は {', '.join(TIMEFRAMES)} のどれかです: {timeframe}")
+    frame = snapshot.frames[timeframe]
+    if bank is not None and (bank == 'Date' or bank not in frame):
+        raise KeyError(bank)
+    start = _timestamp(start) if start is not None else None
+    end = _timestamp(end) if end is not None else None
+    if start is not None or end is not None:
+        dates = frame['Date']
+        keep = pd.Series(True, index=frame.index)
+        if start is not None:
+            keep &= dates >= start
+        if end is not None:
+            keep &= dates <= end
+        frame = frame[keep]
+    in_range = start is not None and start <= snapshot.events.end and (end is None or start <= end)
+    if in_range and (frame.empty or frame['Date'].iloc[0] > start):
+        # 変わった時点だけの表なので、絞り込むと start より前からの金利の行が落ちる → 変更の索引から引いて補う
+        labels = [c for c in frame.columns if c != 'Date']
+        lead = snapshot.events.asof(start, labels)
+        if lead[labels].notna().any(axis=None):
+            frame = pd.concat([lead, frame], ignore_index=True)
+    if bank is not None and discount is not None:
+        frame = frame.assign(MyRate=my_rate_series(frame, bank, discount))
+    return frame.reset_index(drop=True)
+
+
+def _timestamp(value):
+    """指定された日時を、フィードと同じタイムゾーンなしの日時にする(読めなければ ValueError)"""
+    when = pd.Timestamp(value)
+    if pd.isna(when):
+        raise ValueError(f"日時が読めません: {value}")
+    if when.tzinfo is not None:
+        when = when.tz_convert(DATA_TZ).tz_localize(None)
+    return when
+
+
+def write_frame(frame, fmt, out):
+    """表を CSV か JSON(行ごとのオブジェクトの配列)で out に書く"""
+    if fmt == 'json':
+        out.write(frame.to_json(orient='records', date_format='iso', force_ascii=False) + '\n')
+    else:
+        frame.to_csv(out, index=False, lineterminator='\n', float_format='%.10g')
@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class SeriesEvents:
+    """1本の系列で金利が変わった時点の一覧（日付順）
+
+    最初の値も「変更」として1件目に入れます(変更前の金利は NaN)。
+    """
+    dates: np.ndarray  # 新しい金利が適用された日時
+    old: np.ndarray    # 変更前の金利
+    new: np.ndarray    # 変更後の金利
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def nbytes(self):
+        return self.dates.nbytes + self.old.nbytes + self.new.nbytes
+
+
+def extract_events(dates, values):
+    """サンプルの列から、金利が変わった時点だけを取り出す
+
+    空欄(NaN)は「値が届かなかった」だけなので変更とはみなさず、直前の金利が続いているものとします。
+    """
+    valid = ~np.isnan(values)
+    dates, values = dates[valid], values[valid]
+    changed = np.ones(len(values), dtype=bool)
+    changed[1:] = values[1:] != values[:-1]
+    at = np.flatnonzero(changed)
+    old = np.full(len(at), np.nan)
+    old[1:] = values[at[1:] - 1]
+    events = SeriesEvents(dates=dates[at], old=old, new=values[at])
+    # スナップショットに載せて全セッションで共有するので、書き込み禁止にしておく
+    for array in (events.dates, events.old, events.new):
+        array.flags.writeable = False
+    return events
+
+
+class ChangeIndex:
+    """銀行ごとの金利変更の索引。取り込みのたびに1回だけ作り、全ての表示はここから作る
+
+    金利は年に数回しか変わらないので、サンプルの行数ではなく変更の回数に比例した大きさで済みます。
+    end はサンプルの最後の日時で、最後の変更の金利がそこまで続いていることを表します
+    (サンプルが1行も無いときは None)。
+    """
+
+    def __init__(self, series, end):
+        self.series = series  # 系列名 → SeriesEvents
+        self.end = end
+
+    @classmethod
+    def from_frame(cls, df_sorted):
+        """日付順に並んだ (Date, 系列...) の表から作る"""
+        dates = df_sorted['Date'].to_numpy()
+        series = {
+            column: extract_events(dates, df_sorted[column].to_numpy(dtype='float64'))
+            for column in df_sorted.columns if column != 'Date'
+        }
+        return cls(series, dates[-1] if len(dates) else None)
+
+    @property
+    def n_events(self):
+        return sum(len(events) for events in self.series.values())
+
+    @property
+    def nbytes(self):
+        return sum(events.nbytes for events in self.series.values())
+
+    def events(self, label):
+        """1本の系列の変更履歴 (適用日, 変更前, 変更後) の表"""
+        events = self.series[label]
+        return pd.DataFrame({'Date': events.dates, '変更前': events.old, '変更後': events.new})
+
+    def rate_at(self, label, when):
+        """label の when 時点の金利。変更の一覧を二分探索するので O(log 変更回数) で引けます"""
+        return float(self.rates_at(label, when)[0])
+
+    def rates_at(self, label, times):
+        """times(日時1つでも配列でも可)それぞれの時点の label の金利を、まとめて二分探索で引く
+
+        その時点より後の最初の変更の1つ前の金利を返します(最初の値より前の時点は NaN)。
+        """
+        events = self.series[label]
+        times = pd.to_datetime(np.atleast_1d(times)).to_numpy(dtype=events.dates.dtype)
+        if not len(events):
+            return np.full(len(times), np.nan)
+        at = np.searchsorted(events.dates, times, side='right') - 1
+        return np.where(at >= 0, events.new[np.maximum(at, 0)], np.nan)
+
+    def asof(self, times, labels=None):
+        """times それぞれの時点の全系列(または labels)の金利を、Date と並べた表で返す"""
+        labels = list(self.series) if labels is None else labels
+        columns = {'Date': pd.to_datetime(np.atleast_1d(times))}
+        columns.update({label: self.rates_at(label, columns['Date']) for label in labels})
+        return pd.DataFrame(columns)
+
+    def step_frame(self):
+        """どれかの系列が変わった日時(と最後の日時)だけを行に持つ横持ちの表
+
+        各行には、その時点で適用されている全系列の金利が入ります(まだ始まっていない系列は NaN)。
+        step-after で描けば、全サンプルを描いたときと同じ線になります。
+        """
+        ends = [np.array([self.end])] if self.end is not None else []
+        dates = np.unique(np.concatenate([e.dates for e in self.series.values()] + ends))
+        return self.asof(dates)
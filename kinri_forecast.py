@@ -0,0 +1,104 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from kinri_calc import effective_rate
+from kinri_loan import PERCENTILES
+
+# 日銀の変更から何日以内の銀行の変更を「連動した変更」とみなすか
+PASS_THROUGH_WINDOW_DAYS = 180
+# 日銀の変更が履歴に1度も無いときに使う連動率（店頭金利は政策金利とほぼ同じ幅で動く）
+DEFAULT_BETA = 1.0
+
+
+@dataclass(frozen=True)
+class BankFit:
+    """1つの銀行の、日銀の変更に対する店頭金利の連動（パススルー）"""
+    now: float       # 今の店頭金利
+    beta: float      # 日銀が1%動いたときに店頭金利が動く幅
+    resid_sd: float  # 連動で説明できない分のばらつき（日銀の変更1回あたり）
+    n_events: int    # 推定に使った日銀の変更の回数
+
+
+@dataclass(frozen=True)
+class PassThroughFit:
+    """履歴から推定した、日銀の政策金利の動き方と各銀行の連動"""
+    last_date: pd.Timestamp
+    policy_now: float
+    policy_floor: float         # 履歴上の政策金利の最低値（これより下には動かさない）
+    events_per_year: float      # 日銀の変更の頻度
+    policy_moves: np.ndarray    # 過去の日銀の変更幅（シミュレーションではここから引き直す）
+    banks: dict                 # 銀行名 → BankFit
+
+
+def fit_pass_through(events, policy, banks, window_days=PASS_THROUGH_WINDOW_DAYS):
+    """金利変更の索引(ChangeIndex)から、日銀の変更の頻度・幅と、各銀行の連動率を最小二乗で推定する"""
+    policy_events = events.series[policy]
+    # 1件目は最初の値なので、変更としては数えない
+    event_dates = policy_events.dates[1:]
+    moves = policy_events.new[1:] - policy_events.old[1:]
+
+    start = min(e.dates[0] for e in events.series.values() if len(e))
+    span_years = max((events.end - start) / np.timedelta64(365, 'D'), 1 / 12)
+
+    bank_fits = {}
+    for bank in banks:
+        if len(event_dates):
+            # 日銀の変更の前日と、window_days 後の店頭金利の差を、その変更への反応とみなす
+            before = events.rates_at(bank, event_dates - np.timedelta64(1, 'D'))
+            after = events.rates_at(bank, event_dates + np.timedelta64(window_days, 'D'))
+            response = after - before
+            ok = ~np.isnan(response)
+            x, y = moves[ok], response[ok]
+            beta = float(x @ y / (x @ x)) if len(x) else DEFAULT_BETA
+            resid_sd = float(np.std(y - beta * x)) if len(x) > 1 else 0.0
+            n_events = int(ok.sum())
+        else:
+            beta, resid_sd, n_events = DEFAULT_BETA, 0.0, 0
+        now = events.rate_at(bank, events.end)
+        bank_fits[bank] = BankFit(now=now, beta=beta, resid_sd=resid_sd, n_events=n_events)
+
+    return PassThroughFit(
+        last_date=pd.Timestamp(events.end),
+        policy_now=events.rate_at(policy, events.end),
+        policy_floor=float(np.nanmin(policy_events.new)),
+        events_per_year=len(event_dates) / span_years,
+        policy_moves=moves,
+        banks=bank_fits,
+    )
+
+
+def simulate_store_paths(fit, bank, months, n_paths, seed=0):
+    """店頭金利の将来の月次パス (パス数, 月数) をまとめて作る
+
+    日銀の変更はポアソン過程で起き、幅は過去の変更幅から引き直します。
+    店頭金利は 連動率 × 日銀の累積変化 に、変更1回ごとのばらつきを足して動かします。
+    """
+    bank_fit = fit.banks[bank]
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(fit.events_per_year / 12, size=(n_paths, months))
+    if counts.any() and len(fit.policy_moves):
+        k_max = counts.max()
+        draws = rng.choice(fit.policy_moves, size=(n_paths, months, k_max))
+        moves = (draws * (np.arange(k_max) < counts[..., None])).sum(axis=2)
+    else:
+        moves = np.zeros((n_paths, months))
+
+    policy_path = np.maximum(fit.policy_now + np.cumsum(moves, axis=1), fit.policy_floor)
+    noise = rng.normal(0.0, bank_fit.resid_sd, size=(n_paths, months)) * np.sqrt(counts)
+    store_path = bank_fit.now + bank_fit.beta * (policy_path - fit.policy_now) + np.cumsum(noise, axis=1)
+    return np.maximum(store_path, 0.0)
+
+
+def forecast_bands(fit, bank, discount, months=60, n_paths=5000, seed=0, store_paths=None):
+    """My金利 の将来のパーセンタイル帯を月ごとに返す (Date, p5, p25, p50, p75, p95)"""
+    if store_paths is None:
+        store_paths = simulate_store_paths(fit, bank, months, n_paths, seed)
+    my_paths = effective_rate(store_paths, discount)
+    bands = pd.DataFrame(
+        np.percentile(my_paths, PERCENTILES, axis=0).T,
+        columns=[f"p{p}" for p in PERCENTILES],
+    )
+    bands.insert(0, 'Date', pd.date_range(fit.last_date, periods=store_paths.shape[1], freq='MS'))
+    return bands
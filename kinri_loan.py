@@ -0,0 +1,182 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from kinri_calc import effective_rate
+
+# 返済方法
+ANNUITY = "元利均等"
+EQUAL_PRINCIPAL = "元金均等"
+REPAYMENT_METHODS = [ANNUITY, EQUAL_PRINCIPAL]
+
+# 分布を見るときのパーセンタイル
+PERCENTILES = [5, 25, 50, 75, 95]
+
+
+@dataclass(frozen=True)
+class RepaymentResult:
+    """シナリオごとの返済結果（配列の1行目の次元がシナリオ）"""
+    payments: np.ndarray        # (シナリオ数, 返済回数) 毎月の返済額
+    total_interest: np.ndarray  # 利息の総額（未払利息を含む）
+    final_balloon: np.ndarray   # 最終回に一括で払う残り（元金の残り + 未払利息）
+
+    @property
+    def total_paid(self):
+        return self.payments.sum(axis=1) + self.final_balloon
+
+    def payment_bands(self):
+        """毎月の返済額のパーセンタイル (len(PERCENTILES), 返済回数)"""
+        return np.percentile(self.payments, PERCENTILES, axis=0)
+
+
+def annuity_payment(balance, monthly_rate, n_months):
+    """元利均等の毎月の返済額（金利0%のときは元金を均等割り）"""
+    n_months = np.maximum(n_months, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payment = balance * monthly_rate / (1 - (1 + monthly_rate) ** -n_months)
+    return np.where(monthly_rate > 0, payment, balance / n_months)
+
+
+def random_rate_paths(start_rate, months, n_scenarios, annual_vol=0.3, annual_drift=0.0,
+                      review_months=6, seed=0):
+    """店頭金利のシナリオ (シナリオ数, 月数) を作る
+
+    review_months ごとの金利見直しで、正規分布に従う変化が積み上がっていくモデルです。
+    """
+    rng = np.random.default_rng(seed)
+    n_reviews = -(-months // review_months)
+    step = review_months / 12
+    shocks = rng.normal(annual_drift * step, annual_vol * np.sqrt(step), size=(n_scenarios, n_reviews))
+    shocks[:, 0] = 0.0  # 最初の期間は今の金利のまま
+    levels = np.maximum(start_rate + np.cumsum(shocks, axis=1), 0.0)
+    return np.repeat(levels, review_months, axis=1)[:, :months]
+
+
+class AmortizationSchedule:
+    """返済スケジュールを月ごとの状態と一緒に覚えておき、金利が変わった月からだけ計算し直すエンジン
+
+    借入条件(借入額・期間・返済方法・5年ルール・125%ルール)は作るときに固定し、
+    update() に金利シナリオを渡すたびに、前回と違う最初の月から先だけを再計算します。
+    優遇幅の変更はふつう最初の月から効きますが、金利が0%に張り付いている月や、
+    「n年後から金利が変わる」のような先の月だけの変更なら、その手前の計算は使い回します。
+
+    元利均等で five_year_rule=True のときは、返済額を5年ごとにしか見直さず、
+    cap_125=True なら見直し後の返済額を直前の1.25倍までに抑えます。
+    その間に利息が返済額を超えた分は未払利息として持ち越し、最終回にまとめて精算します。
+    keep_states=False にすると月ごとの状態を覚えず(メモリを節約し)、毎回最初から計算します。
+    返す結果の配列はエンジンが使い回すので、次の update() で中身が変わります。
+    """
+
+    def __init__(self, principal, years, method=ANNUITY, five_year_rule=True, cap_125=True, keep_states=True):
+        self.loan = (principal, years, method, five_year_rule, cap_125)
+        self.principal = float(principal)
+        self.n_months = int(years * 12)
+        self.method = method
+        self.five_year_rule = five_year_rule
+        self.cap_125 = cap_125
+        self.keep_states = keep_states
+        self.last_start = None  # 直前の update() で計算し直し始めた月(0始まり)
+        self._rates = None
+        self._result = None
+
+    def update(self, rate_paths):
+        """rate_paths は (シナリオ数, 月数) の適用金利(年利 %)。RepaymentResult を返す"""
+        rates = self._monthly_rates(rate_paths)
+        if self.keep_states and self._rates is not None and self._rates.shape == rates.shape:
+            changed = (rates != self._rates).any(axis=0)
+            if not changed.any():
+                self.last_start = self.n_months
+                return self._result
+            start = int(np.argmax(changed))
+        else:
+            self._allocate(len(rates))
+            start = 0
+
+        self._rates = rates
+        self.last_start = start
+        self._run(start)
+        return self._result
+
+    def _monthly_rates(self, rate_paths):
+        rate_paths = np.atleast_2d(np.asarray(rate_paths, dtype=float))
+        if rate_paths.shape[1] < self.n_months:
+            # シナリオが返済期間より短ければ、最後の金利がそのまま続くものとする
+            pad = np.repeat(rate_paths[:, -1:], self.n_months - rate_paths.shape[1], axis=1)
+            rate_paths = np.hstack([rate_paths, pad])
+        return rate_paths[:, :self.n_months] / 100 / 12
+
+    def _allocate(self, n_scenarios):
+        # 月初の状態(残高・未払利息・その時点の返済額・それまでの利息累計)を月ごとに持つ
+        n_states = self.n_months + 1 if self.keep_states else 1
+        self._balance = np.empty((n_scenarios, n_states))
+        self._unpaid = np.empty((n_scenarios, n_states))
+        self._payment = np.empty((n_scenarios, n_states))
+        self._interest = np.empty((n_scenarios, n_states))
+        self._payments = np.empty((n_scenarios, self.n_months))
+
+    def _run(self, start):
+        rates, n_months = self._rates, self.n_months
+        at = start if self.keep_states else 0
+        if start == 0:
+            self._balance[:, 0] = self.principal
+            self._unpaid[:, 0] = 0.0
+            self._payment[:, 0] = annuity_payment(self.principal, rates[:, 0], n_months)
+            self._interest[:, 0] = 0.0
+        balance = self._balance[:, at].copy()
+        unpaid = self._unpaid[:, at].copy()
+        payment = self._payment[:, at].copy()
+        interest_total = self._interest[:, at].copy()
+        principal_part = self.principal / n_months
+
+        for m in range(start, n_months):
+            rate = rates[:, m]
+            interest = balance * rate
+            interest_total += interest
+
+            if self.method == EQUAL_PRINCIPAL:
+                repaid = np.minimum(principal_part, balance)
+                paid = repaid + interest
+            else:
+                if not self.five_year_rule:
+                    payment = annuity_payment(balance, rate, n_months - m)
+                elif m > 0 and m % 60 == 0:
+                    new_payment = annuity_payment(balance, rate, n_months - m)
+                    payment = np.minimum(new_payment, payment * 1.25) if self.cap_125 else new_payment
+                # 利息(と持ち越した未払利息)から先に払い、残りで元金を減らす
+                due = interest + unpaid
+                interest_paid = np.minimum(payment, due)
+                unpaid = due - interest_paid
+                repaid = np.minimum(payment - interest_paid, balance)
+                paid = interest_paid + repaid
+
+            balance = balance - repaid
+            self._payments[:, m] = paid
+            if self.keep_states:
+                self._balance[:, m + 1] = balance
+                self._unpaid[:, m + 1] = unpaid
+                self._payment[:, m + 1] = payment
+                self._interest[:, m + 1] = interest_total
+
+        self._result = RepaymentResult(
+            payments=self._payments,
+            total_interest=interest_total,
+            final_balloon=balance + unpaid,
+        )
+
+
+def simulate_repayment(principal, years, rate_paths, method=ANNUITY, five_year_rule=True, cap_125=True):
+    """金利シナリオごとの返済額と利息を、全シナリオまとめて計算する(1回限りの計算用)
+
+    rate_paths は (シナリオ数, 月数) の適用金利(年利 %)。
+    """
+    schedule = AmortizationSchedule(principal, years, method, five_year_rule, cap_125, keep_states=False)
+    return schedule.update(rate_paths)
+
+
+def store_rate_scenarios(store_rate, discount, months, n_scenarios, annual_vol=0.3, annual_drift=0.0, seed=0):
+    """今の店頭金利から作ったシナリオを、適用金利 (シナリオ数, 月数) にして返す
+
+    適用金利は My金利 と同じ effective_rate(店頭金利 - 優遇幅、0%未満なし)で計算します。
+    """
+    store_paths = random_rate_paths(store_rate, months, n_scenarios, annual_vol, annual_drift, seed=seed)
+    return effective_rate(store_paths, discount)
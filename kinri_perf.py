@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from contextlib import contextmanager
+
+logger = logging.getLogger("kinri.perf")
+
+# 計測結果を1実行1行の JSON でログに出す(KINRI_PERF_LOG=0 で止められます)
+if os.environ.get("KINRI_PERF_LOG", "1") != "0" and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# tracemalloc はプロセスに1つしか無いので、使っている RunTimer の数を数えておき、
+# 自分で始めたトレースだけを、最後の1つが使い終わったときに止めます
+# (別のセッションの計測の途中で止めてしまわないように)
+_trace_lock = threading.Lock()
+_trace_users = 0
+_trace_started_here = False
+
+
+def _acquire_tracing():
+    global _trace_users, _trace_started_here
+    with _trace_lock:
+        if _trace_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _trace_started_here = True
+        _trace_users += 1
+
+
+def _release_tracing():
+    global _trace_users, _trace_started_here
+    with _trace_lock:
+        _trace_users -= 1
+        if _trace_users == 0 and _trace_started_here:
+            tracemalloc.stop()
+            _trace_started_here = False
+
+
+class RunTimer:
+    """1回のスクリプト実行について、段階ごとの時間とメモリを記録する
+
+    trace_memory=True のときは tracemalloc で段階ごとの確保量とピークも測ります
+    (tracemalloc は Python のメモリ確保すべてに手間が掛かるので、計測パネルを開いている
+    セッションがある間だけ有効にし、log() を呼んだ時点でこの実行の分は使い終わりとします)。
+    tracemalloc はプロセス全体で1つなので、同時に計測しているセッションがあると、
+    そちらの確保も値に混ざります。
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = []
+        self._started = time.perf_counter()
+        self._release = None
+        if trace_memory:
+            _acquire_tracing()
+            # 途中で例外が起きて log() まで来なかったときも、捨てられた時点で使い終わりにする
+            self._release = weakref.finalize(self, _release_tracing)
+
+    def close(self):
+        """メモリの計測を使い終わる(何度呼んでもよい)"""
+        if self._release is not None:
+            self._release()
+
+    @contextmanager
+    def stage(self, name, **info):
+        """with ブロックの処理を name という段階として記録する
+
+        ブロックの中で返される dict に値を入れると、記録に一緒に残せます。
+        """
+        record = {'stage': name, **info}
+        trace = self.trace_memory and self._release.alive
+        if trace:
+            tracemalloc.reset_peak()
+            mem_before = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['ms'] = round((time.perf_counter() - t0) * 1000, 3)
+            if trace:
+                current, peak = tracemalloc.get_traced_memory()
+                record['alloc_kb'] = round((current - mem_before) / 1024, 1)
+                record['peak_kb'] = round((peak - mem_before) / 1024, 1)
+            self.records.append(record)
+
+    def total_ms(self):
+        return round((time.perf_counter() - self._started) * 1000, 3)
+
+    def log(self, **info):
+        """この実行の計測結果をまとめて構造化ログに出す(メモリの計測はここで使い終わる)"""
+        self.close()
+        logger.info(json.dumps(
+            {'event': 'rerun', 'total_ms': self.total_ms(), **info, 'stages': self.records},
+            ensure_ascii=False, default=str,
+        ))
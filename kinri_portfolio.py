@@ -0,0 +1,145 @@
+import io
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from kinri_calc import effective_rate
+from kinri_loan import annuity_payment
+
+# ローン一覧ファイルの列（日本語の見出しでも読めます）
+LOAN_COLUMNS = {
+    'bank': '銀行',         # 借りている銀行（金利の系列名）
+    'discount': '優遇幅',   # 優遇幅 (%)
+    'principal': '借入額',  # 借入額 (円)
+    'term': '期間',         # 返済期間 (年)
+    'start': '借入日',      # 借入日
+}
+
+
+@dataclass(frozen=True)
+class PortfolioResult:
+    """ローンごとの計算結果と、全ローンの月ごとの適用金利"""
+    loans: pd.DataFrame        # 1行1ローン（入力の列に、今の金利・残高・返済額などを足したもの）
+    rate_history: np.ndarray   # (ローン数, 借入からの月数) 各月の適用金利。返済が済んだ月以降は NaN
+    as_of: pd.Timestamp
+
+    @property
+    def priced(self):
+        """金利の履歴がある銀行のローンだけ"""
+        return self.loans[self.loans['rate_now'].notna()]
+
+    @property
+    def unknown(self):
+        """金利の履歴が無い銀行のローンの件数"""
+        return int(self.loans['rate_now'].isna().sum())
+
+    def exposure(self):
+        """銀行ごとの残高・件数・残高で加重した平均金利・毎月の返済額の合計
+
+        金利の履歴が無い銀行のローン(unknown)は含めません。
+        """
+        loans = self.priced.assign(weighted=self.priced['balance'] * self.priced['rate_now'])
+        by_bank = loans.groupby('bank').agg(
+            loans=('bank', 'size'),
+            balance=('balance', 'sum'),
+            weighted=('weighted', 'sum'),
+            payment=('payment_now', 'sum'),
+        )
+        by_bank['rate_now'] = by_bank['weighted'] / by_bank['balance'].where(by_bank['balance'] > 0)
+        return by_bank.drop(columns='weighted').sort_values('balance', ascending=False).reset_index()
+
+
+def read_loans(source):
+    """ローン一覧の CSV(パスか bytes)を読み、(DataFrame, 弾いた行数) を返す
+
+    列は bank, discount, principal, term, start（または 銀行, 優遇幅, 借入額, 期間, 借入日）。
+    数値や日付が読めない行は、全体を失敗にせずその行だけ捨てます。
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    raw = pd.read_csv(source, dtype='str', encoding='utf-8-sig')
+    raw = raw.rename(columns={label: column for column, label in LOAN_COLUMNS.items()})
+    missing = [column for column in LOAN_COLUMNS if column not in raw.columns]
+    if missing:
+        raise ValueError(f"ローン一覧に列がありません: {', '.join(missing)}")
+
+    loans = pd.DataFrame({
+        'bank': raw['bank'].str.strip(),
+        'discount': pd.to_numeric(raw['discount'], errors='coerce'),
+        'principal': pd.to_numeric(raw['principal'].str.replace(',', ''), errors='coerce'),
+        'term': pd.to_numeric(raw['term'], errors='coerce'),
+        'start': pd.to_datetime(raw['start'], format='mixed', errors='coerce'),
+    })
+    valid = loans.notna().all(axis=1) & (loans['principal'] > 0) & (loans['term'] > 0)
+    rejected = int((~valid).sum())
+    return loans[valid].reset_index(drop=True), rejected
+
+
+def price_portfolio(loans, events, as_of=None):
+    """全ローンの月ごとの適用金利・今の残高・今の毎月の返済額を、まとめて計算する
+
+    金利の履歴(ChangeIndex)は銀行ごとに1回だけ二分探索し、全ローン・全月ぶんを一度に引きます。
+    返済は元利均等で、毎月その月の金利で返済額を計算し直すものとします(5年ルールは使いません)。
+    借入日が履歴より前のときは、履歴の最初の金利がその前から続いていたものとします。
+    """
+    as_of = pd.Timestamp(events.end if as_of is None else as_of)
+    n_loans = len(loans)
+    n_months = np.round(loans['term'].to_numpy(dtype=float) * 12).astype(np.int64)
+    start_month = loans['start'].to_numpy().astype('datetime64[M]')
+    elapsed = (np.datetime64(as_of, 'M') - start_month).astype(np.int64)
+    elapsed = np.clip(elapsed, 0, n_months)
+
+    # 各ローンの借入月からの月初の日時 (ローン数, 月数)
+    width = int(max(n_months.max(initial=0), 1))
+    months = start_month[:, None] + np.arange(width)
+    month_dates = months.astype('datetime64[ns]')
+
+    store = np.full((n_loans, width), np.nan)
+    store_now = np.full(n_loans, np.nan)
+    banks = loans['bank'].to_numpy()
+    for bank in np.unique(banks):
+        if bank not in events.series or not len(events.series[bank]):
+            continue
+        rows = np.flatnonzero(banks == bank)
+        first_rate = events.series[bank].new[0]
+        history = events.rates_at(bank, month_dates[rows].ravel()).reshape(len(rows), width)
+        store[rows] = np.where(np.isnan(history), first_rate, history)
+        store_now[rows] = events.rate_at(bank, as_of)
+
+    discount = loans['discount'].to_numpy(dtype=float)
+    rates = effective_rate(store, discount[:, None])
+    rates[np.arange(width) >= n_months[:, None]] = np.nan
+    rate_now = effective_rate(store_now, discount)
+
+    # 借入から今までの返済を、全ローンまとめて1か月ずつ進める
+    balance = loans['principal'].to_numpy(dtype=float).copy()
+    interest_paid = np.zeros(n_loans)
+    for m in range(int(elapsed.max(initial=0))):
+        active = m < elapsed
+        monthly_rate = np.nan_to_num(rates[:, m]) / 100 / 12
+        interest = balance * monthly_rate
+        payment = annuity_payment(balance, monthly_rate, n_months - m)
+        balance = np.where(active, balance - (payment - interest), balance)
+        interest_paid += np.where(active, interest, 0.0)
+
+    remaining = n_months - elapsed
+    balance = np.where(remaining > 0, np.maximum(balance, 0.0), 0.0)
+    payment_now = np.where(
+        remaining > 0, annuity_payment(balance, np.nan_to_num(rate_now) / 100 / 12, remaining), 0.0
+    )
+    # 金利の履歴が無い銀行のローンは計算できないので欠損にする
+    unknown = np.isnan(rate_now)
+    balance[unknown] = payment_now[unknown] = interest_paid[unknown] = np.nan
+
+    result = loans.assign(
+        rate_start=rates[:, 0],
+        rate_now=rate_now,
+        rate_change=rate_now - rates[:, 0],
+        months_paid=elapsed,
+        months_left=remaining,
+        balance=balance,
+        payment_now=payment_now,
+        interest_paid=interest_paid,
+    )
+    return PortfolioResult(loans=result, rate_history=rates, as_of=as_of)
@@ -0,0 +1,160 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from kinri_data import INGEST_MEMORY_BYTES, PARSE_OVERHEAD, IncrementalCsvFetcher, RateStore
+
+
+@dataclass(frozen=True)
+class RateSeries:
+    """金利の系列1本（日銀の政策金利や、各銀行の店頭金利）"""
+    column: str           # フィード上の列名
+    label: str            # 画面表示用の日本語名（グラフの凡例・銀行の選択肢にも使います）
+    policy: bool = False  # 日銀の政策金利
+    major: bool = False   # 「大手平均」に含める銀行
+
+
+# 公開スプレッドシートに入っている系列
+# (並び順がそのままチャートの凡例の順になります)
+SHEET_SERIES = [
+    RateSeries('BOJ', '日銀', policy=True),
+    RateSeries('MUFG', 'UFJ', major=True),
+    RateSeries('Yokohama', '横浜', major=True),
+    RateSeries('Johoku', '城北'),
+]
+
+
+class CsvSource:
+    """公開CSV 1本ぶんのソース。CSV の列がそれぞれ1本の系列になる
+
+    取り込みは IncrementalCsvFetcher で差分だけ行い、database (RateDatabase) を渡すとそこへ、
+    store_dir を渡すとソースごとに <store_dir>/<name>.arrow へ保存します。
+    database に保存するときは、フィードを memory_bytes に収まる大きさずつ読んで書き足します。
+    """
+
+    def __init__(self, name, url, series, store_dir=None, timeout=30, database=None,
+                 memory_bytes=INGEST_MEMORY_BYTES):
+        self.name = name
+        self.series = list(series)
+        chunk_bytes = None
+        if database is not None:
+            store = database.source_store(name)
+            chunk_bytes = max(memory_bytes // PARSE_OVERHEAD, 64 * 1024)
+        else:
+            store = RateStore(os.path.join(store_dir, f"{name}.arrow")) if store_dir else None
+        labels = {s.column: s.label for s in self.series}
+        self.fetcher = IncrementalCsvFetcher(url, labels, timeout=timeout, store=store, chunk_bytes=chunk_bytes)
+
+    @property
+    def df(self):
+        return self.fetcher.df
+
+    @property
+    def version(self):
+        return self.fetcher.version
+
+    @property
+    def sampled_rows(self):
+        return self.fetcher.sampled_rows
+
+    @property
+    def rejected_rows(self):
+        return self.fetcher.rejected_rows
+
+    def load_store(self):
+        return self.fetcher.load_store()
+
+    def fetch(self):
+        return self.fetcher.fetch()
+
+
+def merge_asof_frames(frames):
+    """ソースごとに日付の違う表を、各時点で「その時点までの最新の値」を並べた1つの表にまとめる"""
+    frames = [f.sort_values('Date', ignore_index=True) for f in frames]
+    if len(frames) == 1:
+        return frames[0]
+    timeline = pd.DataFrame({'Date': np.unique(np.concatenate([f['Date'].to_numpy() for f in frames]))})
+    for frame in frames:
+        # 同じ日時の行が複数あるときは後の行(最新の入力)を使う
+        frame = frame.drop_duplicates('Date', keep='last')
+        timeline = pd.merge_asof(timeline, frame, on='Date', direction='backward')
+    return timeline
+
+
+class MultiSourceFetcher:
+    """複数のソースを並行して取り込み、日付で as-of 結合するフェッチャー
+
+    RateRefresher からは IncrementalCsvFetcher と同じように使えます。
+    timeout 秒以内に終わらなかったソースは前回の値のまま結合し、
+    その取得は裏で続けさせて次回の取り込みで結果を拾います。
+    """
+
+    def __init__(self, sources, timeout=30):
+        self.sources = list(sources)
+        self.timeout = timeout
+        self.df = None
+        self.errors = {}    # ソース名 → 直近の取得で起きた例外
+        self._pending = {}  # ソース名 → まだ終わっていない取得(Future)
+        self._pool = ThreadPoolExecutor(max_workers=len(self.sources), thread_name_prefix="kinri-source")
+
+    @property
+    def series(self):
+        return [s for source in self.sources for s in source.series]
+
+    @property
+    def version(self):
+        versions = [source.version or '' for source in self.sources]
+        if not any(versions):
+            return None
+        return hashlib.sha1('|'.join(versions).encode()).hexdigest()[:16]
+
+    @property
+    def sampled_rows(self):
+        return sum(source.sampled_rows for source in self.sources)
+
+    @property
+    def rejected_rows(self):
+        return sum(source.rejected_rows for source in self.sources)
+
+    def load_store(self):
+        """各ソースの保存データを復元する。1つでも復元できたら True"""
+        restored = [source.load_store() for source in self.sources]
+        if any(restored):
+            self._merge()
+        return any(restored)
+
+    def fetch(self):
+        """全ソースを並行して取り込み、(結合した DataFrame, 更新があったか) を返す"""
+        futures = {}
+        for source in self.sources:
+            future = self._pending.pop(source.name, None)
+            futures[source.name] = future or self._pool.submit(source.fetch)
+        wait(futures.values(), timeout=self.timeout)
+
+        changed = False
+        for name, future in futures.items():
+            if not future.done():
+                # 遅いソースに全体を待たせない
+                self._pending[name] = future
+                continue
+            try:
+                _, source_changed = future.result()
+                changed |= source_changed
+                self.errors.pop(name, None)
+            except Exception as e:
+                self.errors[name] = e
+
+        if changed or self.df is None:
+            self._merge()
+        if self.df is None and self.errors:
+            raise next(iter(self.errors.values()))
+        return self.df, changed
+
+    def _merge(self):
+        frames = [source.df for source in self.sources if source.df is not None]
+        if frames:
+            self.df = merge_asof_frames(frames)
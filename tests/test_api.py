@@ -0,0 +1,90 @@
+"""RateApi の応答(ETag と 304、絞り込みの指定の誤り、思わぬ失敗)を HTTP サーバーなしで確かめる"""
+import json
+from http import HTTPStatus
+from urllib.parse import quote
+
+import pandas as pd
+import pytest
+
+import kinri_api
+from kinri_api import RateApi
+from kinri_data import build_snapshot
+
+
+@pytest.fixture(scope='module')
+def snapshot():
+    dates = pd.date_range('2024-01-01', periods=200, freq='h')
+    df = pd.DataFrame({
+        'Date': dates,
+        '日銀': 0.1,
+        '横浜': [2.475] * 100 + [2.725] * 100,
+    })
+    return build_snapshot(df, 'v1')
+
+
+@pytest.fixture
+def api(snapshot):
+    return RateApi(lambda: snapshot)
+
+
+def error_of(response):
+    status, headers, body = response
+    assert headers['Content-Type'].startswith('application/json')
+    return status, json.loads(body)['error']
+
+
+def test_matching_etag_gives_not_modified(api):
+    status, headers, body = api.handle('/latest')
+    assert status == HTTPStatus.OK
+    etag = headers['ETag']
+
+    for if_none_match in (etag, f'W/{etag}', f'"other", {etag}', f'"other", W/{etag}', '*'):
+        status, headers, body = api.handle('/latest', if_none_match)
+        assert status == HTTPStatus.NOT_MODIFIED, if_none_match
+        assert headers['ETag'] == etag
+        assert body == b''
+
+    status, _, body = api.handle('/latest', '"other", W/"another"')
+    assert status == HTTPStatus.OK
+    assert body
+
+
+def test_timezone_aware_dates_are_compared_in_the_feed_timezone(api):
+    # 2024-01-03T00:00:00Z は日本時間の 09:00
+    status, _, body = api.handle('/series?tf=min&start=' + quote('2024-01-03T00:00:00Z'))
+    assert status == HTTPStatus.OK
+    assert json.loads(body)[0]['Date'].startswith('2024-01-03T09:00:00')
+
+    # 横浜は日本時間の 2024-01-05 04:00 に変わる
+    status, _, body = api.handle('/myrate?bank=' + quote('横浜') + '&at=' + quote('2024-01-04T19:00:00Z'))
+    assert status == HTTPStatus.OK
+    assert json.loads(body)[0]['StoreRate'] == 2.725
+
+
+@pytest.mark.parametrize('target', [
+    '/series?start=2021-01-01T00:00:00Z',
+    '/series?end=' + quote('2024-01-05T00:00:00+09:00'),
+])
+def test_timezone_aware_range_is_accepted(api, target):
+    assert api.handle(target)[0] == HTTPStatus.OK
+
+
+@pytest.mark.parametrize('target, want', [
+    ('/series?bank=Date', HTTPStatus.NOT_FOUND),
+    ('/series?bank=' + quote('三井'), HTTPStatus.NOT_FOUND),
+    ('/myrate?bank=Date', HTTPStatus.NOT_FOUND),
+    ('/series?start=yesterday', HTTPStatus.BAD_REQUEST),
+    ('/myrate?at=later', HTTPStatus.BAD_REQUEST),
+])
+def test_bad_parameters_are_client_errors(api, target, want):
+    assert error_of(api.handle(target))[0] == want
+
+
+def test_unexpected_failure_is_a_json_500(api, monkeypatch):
+    def broken(snapshot, query):
+        raise TypeError("broken")
+
+    monkeypatch.setitem(kinri_api.ENDPOINTS, '/latest', broken)
+    status, message = error_of(api.handle('/latest'))
+    assert status == HTTPStatus.INTERNAL_SERVER_ERROR
+    assert 'broken' not in message
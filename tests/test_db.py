@@ -0,0 +1,54 @@
+"""RateDatabase の期間(足)ごとの集計が、pandas で集計したときと同じになることを確かめる"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from kinri_db import RateDatabase
+
+LABELS = ['日銀', 'UFJ', '横浜']
+
+
+@pytest.fixture
+def frame():
+    # 年・週の境目(日曜の深夜〜月曜)をまたぐ不規則な日時に、空欄も混ぜる
+    rng = np.random.default_rng(0)
+    dates = pd.Timestamp('2021-12-25') + pd.to_timedelta(np.sort(rng.integers(0, 800 * 24 * 60, 3000)), unit='min')
+    dates = dates.append(pd.DatetimeIndex(['2022-01-02 23:59:59', '2022-01-03 00:00:00', '2023-12-31 23:59:59']))
+    df = pd.DataFrame({'Date': dates}).drop_duplicates('Date').sort_values('Date', ignore_index=True)
+    for label in LABELS:
+        rates = rng.choice([0.1, 2.475, 2.6, 2.725], len(df))
+        df[label] = np.where(rng.random(len(df)) < 0.3, np.nan, rates)
+    return df
+
+
+@pytest.fixture
+def database(tmp_path, frame):
+    database = RateDatabase(str(tmp_path / 'rates.sqlite'))
+    database.save('sheet', frame, {})
+    return database
+
+
+def pandas_resample(frame, rule):
+    resampled = frame.set_index('Date').resample(rule).last().dropna(how='all')
+    return resampled.reset_index()
+
+
+def assert_same_frame(got, want):
+    assert (got['Date'].to_numpy('datetime64[ns]') == want['Date'].to_numpy('datetime64[ns]')).all()
+    for label in LABELS:
+        np.testing.assert_array_equal(got[label].to_numpy(), want[label].to_numpy())
+
+
+@pytest.mark.parametrize('rule', ['D', 'W', 'YE'])
+def test_resample_matches_pandas(database, frame, rule):
+    got = database.resample(rule, labels=LABELS)
+    want = pandas_resample(frame, rule)
+    assert_same_frame(got, want)
+
+
+@pytest.mark.parametrize('rule', ['D', 'W', 'YE'])
+def test_resample_within_a_range_matches_pandas(database, frame, rule):
+    start, end = pd.Timestamp('2022-01-02 12:00'), pd.Timestamp('2023-06-30')
+    got = database.resample(rule, start, end, labels=LABELS)
+    want = pandas_resample(frame[frame['Date'].between(start, end)], rule)
+    assert_same_frame(got, want)
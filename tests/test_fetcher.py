@@ -0,0 +1,243 @@
+"""IncrementalCsvFetcher の差分取り込みを、ローカルの HTTP サーバーを相手に確かめる
+
+本文を一度に読む取り込み(Arrow に保存)と、少しずつ読んで SQLite に書き足す取り込みの両方を試します。
+"""
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from kinri_data import IncrementalCsvFetcher, RateRefresher, RateStore, build_snapshot, parse_csv
+from kinri_db import RateDatabase
+from kinri_sources import SHEET_SERIES
+
+LABELS = {s.column: s.label for s in SHEET_SERIES}
+HEADER = b"Date,BOJ,MUFG,Yokohama,Johoku\r\n"
+
+
+def make_rows(start, n, mufg=2.475):
+    dates = pd.date_range(start, periods=n, freq='h')
+    return b''.join(
+        f"{d:%Y-%m-%d %H:%M:%S},-0.1,{mufg},2.975,2.6\r\n".encode() for d in dates
+    )
+
+
+class FeedServer:
+    """本文を差し替えられる公開CSVの代わり。ETag を付け、If-None-Match が一致すれば 304 を返す"""
+
+    def __init__(self):
+        self.body = b''
+        self.statuses = []
+        feed = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                etag = f'"{hashlib.sha1(feed.body).hexdigest()}"'
+                if self.headers.get('If-None-Match') == etag:
+                    feed.statuses.append(304)
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                feed.statuses.append(200)
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(len(feed.body)))
+                self.end_headers()
+                self.wfile.write(feed.body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/rates.csv"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def feed():
+    server = FeedServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture(params=['whole', 'chunked'])
+def store(request, tmp_path):
+    if request.param == 'whole':
+        return RateStore(str(tmp_path / 'sheet.arrow'))
+    return RateDatabase(str(tmp_path / 'kinri.sqlite')).source_store('sheet')
+
+
+@pytest.fixture
+def make_fetcher(feed, store):
+    # 少しずつ読む取り込みは、1回に読む大きさを小さくして何度にも分けて読ませる
+    chunk_bytes = None if isinstance(store, RateStore) else 700
+    return lambda: IncrementalCsvFetcher(feed.url, LABELS, store=store, chunk_bytes=chunk_bytes)
+
+
+def expected(body):
+    df, _ = parse_csv(body, LABELS)
+    return df
+
+
+def assert_same_history(fetcher, body):
+    """全件を一度にパースしたときと同じスナップショット(変更の索引と表)が作れること
+
+    少しずつ読む取り込みでは fetcher.df は詰めた表なので、行どうしではなくスナップショットで比べます。
+    """
+    want = expected(body)
+    got = build_snapshot(fetcher.df, fetcher.version, fetcher.rejected_rows, fetcher.sampled_rows)
+    ref = build_snapshot(want, fetcher.version)
+    assert got.sampled_rows == len(want)
+    assert (got.df['Date'].to_numpy('datetime64[ns]') == ref.df['Date'].to_numpy('datetime64[ns]')).all()
+    for label in LABELS.values():
+        assert (got.df[label].to_numpy() == ref.df[label].to_numpy()).all()
+    if not isinstance(fetcher.store, RateStore):
+        assert fetcher.store.database.count() == len(want)
+
+
+def test_initial_then_not_modified(feed, make_fetcher):
+    feed.body = HEADER + make_rows('2024-01-01', 100)
+    fetcher = make_fetcher()
+
+    df, changed = fetcher.fetch()
+    assert changed
+    assert_same_history(fetcher, feed.body)
+    version = fetcher.version
+
+    df, changed = fetcher.fetch()
+    assert not changed
+    assert feed.statuses == [200, 304]
+    assert fetcher.version == version
+
+
+def test_append_parses_only_the_tail(feed, make_fetcher, monkeypatch):
+    feed.body = HEADER + make_rows('2024-01-01', 100)
+    fetcher = make_fetcher()
+    fetcher.fetch()
+
+    tail = make_rows('2024-01-05 04:00', 20, mufg=2.725)
+    feed.body += tail
+    parsed = []
+    import kinri_data
+    original = kinri_data.parse_csv
+    monkeypatch.setattr(kinri_data, 'parse_csv', lambda raw, labels: parsed.append(raw) or original(raw, labels))
+
+    df, changed = fetcher.fetch()
+    assert changed
+    assert all(raw.startswith(HEADER) for raw in parsed)
+    assert b''.join(raw[len(HEADER):] for raw in parsed) == tail
+    assert_same_history(fetcher, feed.body)
+    assert fetcher.df['UFJ'].iloc[-1] == 2.725
+
+
+def test_rewritten_rows_are_parsed_again(feed, make_fetcher):
+    feed.body = HEADER + make_rows('2024-01-01', 100)
+    fetcher = make_fetcher()
+    fetcher.fetch()
+    version = fetcher.version
+
+    # 途中の行を書き換え、さらに1行追記する
+    feed.body = HEADER + make_rows('2024-01-01', 50) + make_rows('2024-01-03 02:00', 51, mufg=2.6)
+    df, changed = fetcher.fetch()
+    assert changed
+    assert fetcher.version != version
+    assert_same_history(fetcher, feed.body)
+
+
+def test_restart_restores_and_keeps_fetching_incrementally(feed, make_fetcher):
+    feed.body = HEADER + make_rows('2024-01-01', 100)
+    make_fetcher().fetch()
+
+    fetcher = make_fetcher()
+    assert fetcher.load_store()
+    assert_same_history(fetcher, feed.body)
+    # 保存した ETag で条件付きリクエストを送る
+    assert not fetcher.fetch()[1]
+    assert feed.statuses == [200, 304]
+
+    feed.body += make_rows('2024-01-05 04:00', 20, mufg=2.725)
+    assert fetcher.fetch()[1]
+    assert_same_history(fetcher, feed.body)
+
+
+def test_header_only_feed_gives_no_snapshot_across_restarts(feed, make_fetcher):
+    feed.body = HEADER
+    for _ in range(2):  # 2回目は保存データからの再起動
+        fetcher = make_fetcher()
+        assert not fetcher.load_store()
+        refresher = RateRefresher(fetcher, interval=3600).start()
+        assert refresher.wait_snapshot(timeout=10) is None
+        assert refresher.last_error is None
+
+
+def test_unterminated_last_line_is_reparsed_when_it_grows(feed, make_fetcher):
+    # スプレッドシートの公開CSVは最後の行が改行で終わらず、空欄だった最後の列があとから埋まることがある
+    rows = make_rows('2024-01-01', 100)
+    feed.body = HEADER + rows + b"2024-01-05 04:00:00,-0.1,2.475,2.975,"
+    fetcher = make_fetcher()
+    assert fetcher.fetch()[1]
+    assert_same_history(fetcher, feed.body)
+
+    feed.body = HEADER + rows + b"2024-01-05 04:00:00,-0.1,2.475,2.975,2.7\r\n2024-01-05 05:00:00,-0.1,2.5,2.975,2.7"
+    assert fetcher.fetch()[1]
+    assert_same_history(fetcher, feed.body)
+    assert fetcher.df['城北'].iloc[-1] == 2.7
+
+    # 再起動しても、書きかけの行を読み直すところから続けられる
+    feed.body += b"5\r\n"
+    restarted = make_fetcher()
+    assert restarted.load_store()
+    assert restarted.fetch()[1]
+    assert_same_history(restarted, feed.body)
+    assert restarted.df['城北'].iloc[-1] == 2.75
+
+
+@pytest.mark.parametrize('engine', ['pyarrow', 'c'])
+def test_rows_with_extra_fields_are_rejected(engine, monkeypatch):
+    import kinri_data
+    monkeypatch.setattr(kinri_data, 'CSV_ENGINE', engine)
+    for bad in (b"2024-01-02 00:00:00,0.1,2.475,2.475,2.6,oops\r\n",
+                b"2024-01-02 00:00:00,0.1,x,2.475,2.6,oops\r\n"):  # 文字列で読み直す側
+        raw = HEADER + make_rows('2024-01-01', 3) + bad + make_rows('2024-01-03', 2)
+        df, rejected = parse_csv(raw, LABELS)
+        assert rejected == 1
+        assert len(df) == 5
+
+
+def test_feed_with_a_broken_row_keeps_the_rest(feed, make_fetcher):
+    feed.body = HEADER + make_rows('2024-01-01', 50) + b"2024-01-03 02:00:00,0.1,2.475,2.475,2.6,oops\r\n"
+    feed.body += make_rows('2024-01-03 03:00', 50)
+    fetcher = make_fetcher()
+    assert fetcher.fetch()[1]
+    assert fetcher.rejected_rows == 1
+    assert_same_history(fetcher, feed.body)
+
+
+def test_unterminated_last_line_that_turns_bad_is_taken_back(feed, make_fetcher):
+    rows = make_rows('2024-01-01', 100)
+    feed.body = HEADER + rows + b"2024-01-05 04:00:00,-0.1,2.6,2.975,2.6"
+    fetcher = make_fetcher()
+    assert fetcher.fetch()[1]
+    assert fetcher.df['UFJ'].iloc[-1] == 2.6
+
+    # 書きかけの行が弾かれる中身になったら、前回その行から取り込んだ金利の変化も取り消す
+    feed.body = HEADER + rows + b"2024-01-05 04:00:00,-0.1,2.6,2.975,2.6x"
+    assert fetcher.fetch()[1]
+    assert fetcher.rejected_rows == 1
+    assert_same_history(fetcher, feed.body)
+    assert fetcher.df['UFJ'].iloc[-1] == 2.475
+
+    restarted = make_fetcher()
+    assert restarted.load_store()
+    feed.body = HEADER + rows + make_rows('2024-01-05 04:00', 3, mufg=2.725)
+    assert restarted.fetch()[1]
+    assert restarted.rejected_rows == 0
+    assert_same_history(restarted, feed.body)
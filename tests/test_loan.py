@@ -0,0 +1,47 @@
+"""途中の月から計算し直す返済スケジュールが、最初から計算したときと同じ結果になることを確かめる"""
+import numpy as np
+import pytest
+
+from kinri_loan import ANNUITY, EQUAL_PRINCIPAL, AmortizationSchedule, random_rate_paths, simulate_repayment
+
+LOAN = (35_000_000, 35)
+
+
+def assert_same_result(got, want):
+    np.testing.assert_allclose(got.payments, want.payments, rtol=1e-12)
+    np.testing.assert_allclose(got.total_interest, want.total_interest, rtol=1e-12)
+    np.testing.assert_allclose(got.final_balloon, want.final_balloon, rtol=1e-12, atol=1e-6)
+
+
+@pytest.mark.parametrize('method, five_year_rule, cap_125', [
+    (ANNUITY, True, True),
+    (ANNUITY, True, False),
+    (ANNUITY, False, False),
+    (EQUAL_PRINCIPAL, False, False),
+])
+@pytest.mark.parametrize('changed_from', [0, 59, 60, 70, 419])
+def test_update_after_a_rate_change_matches_a_fresh_simulation(method, five_year_rule, cap_125, changed_from):
+    months = LOAN[1] * 12
+    paths = random_rate_paths(0.9, months, 50, annual_vol=0.5, seed=1)
+    schedule = AmortizationSchedule(*LOAN, method, five_year_rule, cap_125)
+    schedule.update(paths)
+
+    # 途中の月から先だけ金利を上げる(見直しの月をまたぐ変更も含む)
+    raised = paths.copy()
+    raised[:, changed_from:] += 1.5
+    got = schedule.update(raised)
+    assert schedule.last_start == changed_from
+    assert_same_result(got, simulate_repayment(*LOAN, raised, method, five_year_rule, cap_125))
+
+    # 元に戻しても、最初から計算したときと同じになる
+    got = schedule.update(paths)
+    assert schedule.last_start == changed_from
+    assert_same_result(got, simulate_repayment(*LOAN, paths, method, five_year_rule, cap_125))
+
+
+def test_unchanged_rates_reuse_the_result():
+    paths = random_rate_paths(0.9, LOAN[1] * 12, 10, seed=2)
+    schedule = AmortizationSchedule(*LOAN)
+    first = schedule.update(paths)
+    assert schedule.update(paths.copy()) is first
+    assert schedule.last_start == schedule.n_months